@@ -0,0 +1,66 @@
+import base64
+import hashlib
+import json
+
+import ingest
+import paging
+
+# JSON read API. Pages are keyset-paged through paging.fetch_page; the cursor handed out is
+# opaque to clients and only valid for the same sort.
+API_VERSION = 'v1'
+MAX_LIMIT = 1000
+
+
+def encode_cursor(cursor):
+    if cursor is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(cursor, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        value, rowid = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(rowid, int):
+        raise ValueError('Invalid cursor')
+    return value, rowid
+
+
+def etag(table_name, version, params):
+    # Same table version and same query string give the same representation
+    query = json.dumps(sorted((key, value) for key, value in params.items() if value is not None))
+    digest = hashlib.sha1(query.encode()).hexdigest()[:16]
+    return f'"{API_VERSION}-{table_name}-{version}-{digest}"'
+
+
+def etag_matches(if_none_match, tag):
+    if not if_none_match:
+        return False
+    candidates = {candidate.strip().removeprefix('W/') for candidate in if_none_match.split(',')}
+    return '*' in candidates or tag in candidates
+
+
+def fetch_rows(conn, table_name, fields=None, since=None, until=None, sort=None, descending=False, cursor=None, limit=paging.PAGE_SIZE):
+    # {'table', 'rows', 'next_cursor'}; fields limits each row to the named columns
+    columns = paging.table_columns(conn, table_name)
+    unknown = [field for field in fields or () if field not in columns]
+    if unknown:
+        raise ValueError(f"Unknown field for {table_name}: {', '.join(unknown)}")
+    ranges = None
+    if since or until:
+        time_column = ingest.time_column(table_name)
+        if time_column is None:
+            raise ValueError(f"{table_name} has no time column")
+        ranges = {time_column: ingest.time_range(since, until)}
+    rows, next_cursor = paging.fetch_page(
+        conn, table_name, sort_column=sort, descending=descending,
+        cursor=decode_cursor(cursor) if cursor else None,
+        ranges=ranges, limit=max(1, min(limit, MAX_LIMIT)),
+    )
+    fields = fields or columns
+    return {
+        'table': table_name,
+        'rows': [{field: row[field] for field in fields} for row in rows],
+        'next_cursor': encode_cursor(next_cursor),
+    }
@@ -0,0 +1,175 @@
+import argparse
+import os
+import sys
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+import db
+import export
+import ingest
+import rollups
+import schema
+
+# Cold storage for old rows: whole months are moved out of SQLite into Parquet files laid out as
+# <archive dir>/<table>/<YYYY-MM>/part-<id>.parquet. ArchivePartitions lists every file with its
+# time span; a file not listed there (left by an interrupted run) is never read.
+# Rollups keep counting archived rows, so the dashboard still covers the full history. The
+# Conversations summary and search indexes describe the live table only. An archived month is
+# closed: ingest.bulk_insert drops incoming rows timed in it rather than store them a second time.
+
+ARCHIVE_DIR = 'archive'
+ARCHIVE_TABLES = ('Keylogs', 'Messages')
+# Months that ended more than this many days ago are archived
+KEEP_DAYS = 365
+
+
+def month_start(value):
+    return value[:7] + '-01'
+
+
+def next_month(month):
+    year, number = int(month[:4]), int(month[5:7])
+    return f"{year + number // 12:04d}-{number % 12 + 1:02d}-01"
+
+
+def cutoff_for(keep_days, today=None):
+    # First day of the month keep_days ago, so only whole months are archived
+    return month_start(((today or date.today()) - timedelta(days=keep_days)).isoformat())
+
+
+def archive_table(conn, table_name, cutoff, archive_dir=ARCHIVE_DIR, batch_size=export.EXPORT_BATCH):
+    # Moves the rows of table_name timed before cutoff into one new Parquet file per month and
+    # returns [(month, rows)]. Each month is written first and then deleted in a short write
+    # transaction bounded by the highest rowid seen at the start, so rows ingested meanwhile
+    # (which get higher rowids) stay in the table even when their time is old.
+    time_column = ingest.time_column(table_name)
+    if time_column is None:
+        raise ValueError(f"{table_name} has no time column")
+    cutoff = month_start(cutoff)
+    max_rowid = conn.execute(f"SELECT MAX(rowid) FROM {table_name}").fetchone()[0]
+    if max_rowid is None:
+        return []
+    months = [row[0] for row in conn.execute(
+        f"SELECT DISTINCT substr({time_column}, 1, 7) FROM {table_name} WHERE {time_column} < ? ORDER BY 1", (cutoff,))]
+
+    archived = []
+    for month in months:
+        where = f"{time_column} >= ? AND {time_column} < ? AND rowid <= ?"
+        params = (month + '-01', min(next_month(month), cutoff), max_rowid)
+        count, min_time, max_time = conn.execute(
+            f"SELECT COUNT(*), MIN({time_column}), MAX({time_column}) FROM {table_name} WHERE {where}", params).fetchone()
+        if not count:
+            continue
+        file_name = os.path.join(table_name, month, f"part-{uuid.uuid4().hex[:12]}.parquet")
+        path = os.path.join(archive_dir, file_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        cursor = conn.execute(f"SELECT * FROM {table_name} WHERE {where} ORDER BY rowid", params)
+        with open(path + '.tmp', 'wb') as f:
+            for chunk in export.iter_parquet(export.cursor_batches(conn, cursor, table_name, batch_size)):
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            rollups.add_rows(conn, table_name, where, params)
+            deleted = conn.execute(f"DELETE FROM {table_name} WHERE {where}", params).rowcount
+            if deleted != count:
+                raise RuntimeError(f"{table_name} {month}: {count} rows written but {deleted} deleted")
+            conn.execute('''
+                INSERT INTO ArchivePartitions (file_name, table_name, month, min_time, max_time, row_count)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (file_name, table_name, month, min_time, max_time, count))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            os.remove(path)
+            raise
+        archived.append((month, count))
+    return archived
+
+
+def partitions(conn, table_name, since=None, until=None):
+    # (file name, min time, max time) of the archived files whose time span overlaps [since, until]
+    conditions, params = ['table_name = ?'], [table_name]
+    if since:
+        conditions.append('max_time >= ?')
+        params.append(since)
+    if until:
+        conditions.append('min_time <= ?')
+        params.append(until)
+    return conn.execute(f'''
+        SELECT file_name, min_time, max_time FROM ArchivePartitions
+        WHERE {' AND '.join(conditions)} ORDER BY min_time
+    ''', params).fetchall()
+
+
+def query(conn, table_name, since=None, until=None, archive_dir=ARCHIVE_DIR, batch_size=export.EXPORT_BATCH):
+    # Yields (column names, rows) batches of the table's rows timed within [since, until]: first
+    # from the archived months overlapping the range, then from the live table. Only partitions at
+    # the edges of the range are filtered row by row. Names are per batch because files written
+    # before a schema change lack the columns added since.
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    time_column = ingest.time_column(table_name)
+    if time_column is None:
+        raise ValueError(f"{table_name} has no time column")
+    since, until = ingest.time_range(since, until)
+    for file_name, min_time, max_time in partitions(conn, table_name, since, until):
+        parquet = pq.ParquetFile(os.path.join(archive_dir, file_name))
+        for batch in parquet.iter_batches(batch_size):
+            if since and min_time < since:
+                batch = batch.filter(pc.greater_equal(batch.column(time_column), since))
+            if until and max_time > until:
+                batch = batch.filter(pc.less_equal(batch.column(time_column), until))
+            if batch.num_rows:
+                yield batch.schema.names, list(zip(*(column.to_pylist() for column in batch.columns)))
+
+    sql, params = export.export_query(conn, table_name, since=since, until=until)
+    for names, _, rows in export.cursor_batches(conn, conn.execute(sql, params), table_name, batch_size):
+        if rows:
+            yield names, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Move old rows out of the database into monthly Parquet files.')
+    parser.add_argument('tables', nargs='*', default=list(ARCHIVE_TABLES), help=f"default: {' '.join(ARCHIVE_TABLES)}")
+    parser.add_argument('--database', default='data.db')
+    parser.add_argument('--archive-dir', default=ARCHIVE_DIR)
+    cutoff = parser.add_mutually_exclusive_group()
+    cutoff.add_argument('--keep-days', type=int, default=KEEP_DAYS, help='archive months that ended before this many days ago')
+    cutoff.add_argument('--before', help='archive months before this date (YYYY-MM-DD)')
+    parser.add_argument('--vacuum', action='store_true', help='compact the database file afterwards')
+    args = parser.parse_args()
+
+    unknown = [table_name for table_name in args.tables if ingest.time_column(table_name) is None]
+    if unknown:
+        parser.error(f"cannot archive {', '.join(unknown)}: unknown table or no time column")
+    if args.before:
+        try:
+            before = datetime.strptime(args.before, '%Y-%m-%d').date().isoformat()
+        except ValueError:
+            parser.error('--before must be a date (YYYY-MM-DD)')
+    else:
+        before = cutoff_for(args.keep_days)
+
+    conn = db.connect(args.database)
+    schema.migrate(conn)
+    start = time.perf_counter()
+    total = 0
+    for table_name in args.tables:
+        for month, count in archive_table(conn, table_name, before, args.archive_dir):
+            print(f'{table_name} {month}: {count:,} rows archived')
+            total += count
+    if args.vacuum and total:
+        conn.execute('VACUUM')
+    conn.close()
+    print(f'\n{total:,} rows before {month_start(before)} archived in {time.perf_counter() - start:.1f}s')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,12 @@
+from fastapi import FastAPI
+from nicegui import ui
+
+import main  # registers the pages and API routes on NiceGUI's app
+
+# ASGI entry point for multi-process serving; see gunicorn.conf.py. Every worker imports this
+# module after the fork, so database connections and thread pools are opened per process.
+# The JSON API and export endpoints are stateless and can be served by any worker. NiceGUI pages
+# keep their state in the process that rendered them, so with more than one worker the
+# proxy in front must route each client to the same worker (session affinity).
+server = FastAPI()
+ui.run_with(server, title='Data Management System')
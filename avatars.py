@@ -0,0 +1,67 @@
+import base64
+import hashlib
+import html
+from functools import lru_cache
+from urllib.parse import quote
+
+# Deterministic initials avatars generated locally instead of fetched from ui-avatars.com.
+# An avatar depends only on its initials and colour, so URLs carry those rather than names.
+PALETTE = [
+    '#1abc9c', '#2ecc71', '#3498db', '#9b59b6', '#34495e', '#16a085', '#27ae60', '#2980b9',
+    '#8e44ad', '#f39c12', '#d35400', '#c0392b', '#7f8c8d', '#e67e22', '#e74c3c', '#6d4c41',
+]
+AVATAR_CACHE_SIZE = 4096
+# Most frequent contacts whose avatars are inlined as data URIs instead of requested
+DATA_URI_CONTACTS = 50
+# Each URL's content never changes, so browsers may keep it indefinitely
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+ROUTE = '/avatars'
+
+
+def initials(name):
+    words = [word for word in str(name or '').split() if word[:1].isalpha()]
+    if not words:
+        return '#'
+    if len(words) == 1:
+        return words[0][0].upper()
+    return (words[0][0] + words[-1][0]).upper()
+
+
+def color_index(name):
+    return hashlib.md5(str(name or '').encode()).digest()[0] % len(PALETTE)
+
+
+@lru_cache(maxsize=AVATAR_CACHE_SIZE)
+def render(letters, color):
+    # Returns (svg bytes, etag)
+    svg = (
+        '<svg xmlns="http://www.w3.org/2000/svg" width="64" height="64" viewBox="0 0 64 64">'
+        f'<rect width="64" height="64" fill="{PALETTE[color]}"/>'
+        '<text x="32" y="32" dy=".35em" text-anchor="middle" font-family="Helvetica, Arial, sans-serif" '
+        f'font-size="26" fill="#fff">{html.escape(letters)}</text></svg>'
+    ).encode()
+    return svg, '"' + hashlib.sha1(svg).hexdigest() + '"'
+
+
+def avatar_url(name):
+    return f"{ROUTE}/{color_index(name)}/{quote(initials(name), safe='')}.svg"
+
+
+@lru_cache(maxsize=AVATAR_CACHE_SIZE)
+def data_uri(name):
+    svg, _ = render(initials(name), color_index(name))
+    return 'data:image/svg+xml;base64,' + base64.b64encode(svg).decode()
+
+
+def image(name, frequent=()):
+    # Inlined for the names in frequent (the busiest contacts), so the first screen needs no
+    # avatar requests; everyone else's is fetched and cached by URL
+    return data_uri(name) if name in frequent else avatar_url(name)
+
+
+def frequent_names(conn, limit=DATA_URI_CONTACTS):
+    # Display names of the busiest conversations, as rendered by the Messages tab
+    return [row[0] for row in conn.execute('''
+        SELECT IFNULL((SELECT name FROM Contacts WHERE phone_norm = counterpart ORDER BY name LIMIT 1), counterpart)
+        FROM Conversations ORDER BY total_count DESC LIMIT ?
+    ''', (limit,))]
@@ -0,0 +1,163 @@
+import argparse
+import csv
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ingest
+
+# Seeded generator of device exports in the formats the importers see in practice: times as
+# "Jan 1, 10:00 AM", durations as "5 Min & 30 Sec", phone numbers written several ways. Contacts,
+# apps and words are drawn with a long-tailed distribution, so a few conversations and
+# applications dominate the way they do in real exports. The same seed always gives the same files.
+
+MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+WORDS = ('ok yes no thanks call me later tonight tomorrow meeting home work love you see soon '
+         'where are what time dinner lunch coffee pick up kids school running late sorry send the '
+         'address photo link invoice payment bank code verify account password delivery order '
+         'shipped arrived doctor appointment weekend trip flight hotel ticket game score happy '
+         'birthday congratulations').split()
+APPS = [('WhatsApp', 'com.whatsapp'), ('Messenger', 'com.facebook.orca'), ('Instagram', 'com.instagram.android'),
+        ('Chrome', 'com.android.chrome'), ('Gmail', 'com.google.android.gm'), ('Telegram', 'org.telegram.messenger'),
+        ('Snapchat', 'com.snapchat.android'), ('TikTok', 'com.zhiliaoapp.musically'), ('Maps', 'com.google.android.apps.maps'),
+        ('Spotify', 'com.spotify.music'), ('Signal', 'org.thoughtcrime.securesms'), ('Notes', 'com.samsung.android.app.notes')]
+FIRST_NAMES = ['Alex', 'Sam', 'Jordan', 'Taylor', 'Chris', 'Pat', 'Morgan', 'Jamie', 'Casey', 'Riley', 'Drew', 'Robin']
+LAST_NAMES = ['Smith', 'Garcia', 'Lee', 'Patel', 'Brown', 'Nguyen', 'Miller', 'Davis', 'Lopez', 'Wilson', 'Khan', 'Moore']
+CITIES = ['New York', 'Los Angeles', 'Chicago', 'Houston', 'Phoenix', 'Seattle', 'Denver', 'Boston', '']
+CALL_TYPES = ['Incoming', 'Outgoing', 'Missed']
+MESSAGE_TYPES = ['SMS', 'MMS']
+CONTACTS = 2000
+# Exports cover one year; times carry no year, as in the device exports
+START = datetime(2023, 1, 1)
+
+
+def skewed(rng, items, skew=1.2):
+    # Long-tailed pick: low indexes are chosen far more often than high ones
+    return items[min(int(rng.paretovariate(skew)) - 1, len(items) - 1)]
+
+
+def export_time(moment):
+    return f"{MONTHS[moment.month - 1]} {moment.day}, {moment.hour % 12 or 12}:{moment.minute:02d} {'AM' if moment.hour < 12 else 'PM'}"
+
+
+def export_duration(seconds):
+    minutes, seconds = divmod(seconds, 60)
+    if not minutes:
+        return f"{seconds} Sec"
+    return f"{minutes} Min & {seconds} Sec"
+
+
+def phone_formats(number):
+    # The same number as different exports write it
+    area, exchange, line = number[:3], number[3:6], number[6:]
+    return [f"+1{number}", f"({area}) {exchange}-{line}", f"{area}-{exchange}-{line}", f"+1 {area} {exchange} {line}"]
+
+
+class Generator:
+    # Every table shares the seed's contact book, so calls and messages match the Contacts export;
+    # the rows of each table come from their own stream, so adding a table leaves the others unchanged
+    def __init__(self, seed=0, table_name='', contacts=CONTACTS):
+        rng = random.Random(seed)
+        numbers = [f"{rng.randint(201, 989)}{rng.randint(200, 999)}{rng.randint(0, 9999):04d}" for _ in range(contacts)]
+        self.contacts = [(f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}", number) for number in numbers]
+        self.rng = random.Random(f"{seed}:{table_name}")
+
+    def text(self, words):
+        return ' '.join(skewed(self.rng, WORDS, 0.8) for _ in range(words)).capitalize()
+
+    def phone(self):
+        _, number = skewed(self.rng, self.contacts, 0.6)
+        return self.rng.choice(phone_formats(number))
+
+    def times(self, rows):
+        # Increasing times spread over the year, as exports list events in order
+        step = 365 * 24 * 3600 / max(rows, 1)
+        for index in range(rows):
+            yield START + timedelta(seconds=int(index * step + self.rng.random() * step))
+
+    def values(self, table_name, moment, index):
+        rng = self.rng
+        if table_name == 'Calls':
+            return {'call_type': rng.choice(CALL_TYPES), 'time': export_time(moment), 'from_to': self.phone(),
+                    'duration_sec': export_duration(int(rng.expovariate(1 / 180))), 'location': rng.choice(CITIES)}
+        if table_name == 'Messenger':
+            return {'contact_name': skewed(rng, self.contacts, 0.6)[0], 'message_time': export_time(moment),
+                    'message_text': self.text(rng.randint(1, 30))}
+        if table_name == 'SMS':
+            return {'phone_number': self.phone(), 'message_time': export_time(moment),
+                    'message_text': self.text(rng.randint(1, 25)), 'location': rng.choice(CITIES)}
+        if table_name == 'Messages':
+            return {'message_type': rng.choice(MESSAGE_TYPES), 'time': export_time(moment), 'from_to': self.phone(),
+                    'message': self.text(rng.randint(1, 25))}
+        if table_name == 'Contacts':
+            name, number = self.contacts[index % len(self.contacts)]
+            suffix = '' if index < len(self.contacts) else f" {index // len(self.contacts) + 1}"
+            return {'name': name + suffix, 'phone_number': rng.choice(phone_formats(number)),
+                    'email': f"{name.lower().replace(' ', '.')}{index}@example.com"}
+        if table_name == 'InstalledApps':
+            app_name, package_name = APPS[index % len(APPS)]
+            version = '' if index < len(APPS) else f" {index // len(APPS)}"
+            return {'app_name': app_name + version, 'package_name': package_name + version.replace(' ', '.v'),
+                    'install_date': export_time(moment)}
+        if table_name == 'Keylogs':
+            return {'application': skewed(rng, APPS)[0], 'time': export_time(moment), 'text': self.text(rng.randint(1, 12))}
+        raise ValueError(f"Unknown table: {table_name}")
+
+    def rows(self, table_name, rows):
+        # Header row, then one list per data row
+        header = [source if isinstance(source, str) else source[0]
+                  for _, source, conversion in ingest.TABLE_COLUMNS[table_name] if conversion != 'phone']
+        yield header
+        for index, moment in enumerate(self.times(rows)):
+            values = self.values(table_name, moment, index)
+            yield [values[column] for column in header]
+
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='') as f:
+        csv.writer(f).writerows(rows)
+
+
+def write_xlsx(path, rows):
+    from openpyxl import Workbook
+
+    # write_only streams rows to disk instead of holding the sheet in memory
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    for row in rows:
+        sheet.append(row)
+    workbook.save(path)
+
+
+WRITERS = {'csv': write_csv, 'xlsx': write_xlsx}
+
+
+def generate(out_dir, tables, rows, export_format='csv', seed=0):
+    # Returns {table: path}
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {}
+    for table_name in tables:
+        path = os.path.join(out_dir, f"{table_name.lower()}.{export_format}")
+        WRITERS[export_format](path, Generator(seed, table_name).rows(table_name, rows))
+        paths[table_name] = path
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write seeded synthetic device exports for benchmarking.')
+    parser.add_argument('--out', default='bench-data')
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--tables', nargs='*', default=list(ingest.TABLE_COLUMNS))
+    parser.add_argument('--format', choices=list(WRITERS), default='csv')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    for table_name, path in generate(args.out, args.tables, args.rows, args.format, args.seed).items():
+        print(f"{table_name:<15}{os.path.getsize(path) / 1e6:>10,.1f} MB  {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+import argparse
+import os
+import random
+import re
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ingest
+import schema
+from converters import normalize_phone
+
+MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+
+# The per-cell converters main.py used before converters.py, minus the UI calls
+def convert_time_to_string(time_str):
+    try:
+        year_match = re.search(r"(\d{4})", time_str)
+        year = year_match.group(1) if year_match else datetime.now().year
+        return datetime.strptime(f"{year} {time_str}", '%Y %b %d, %I:%M %p').strftime('%Y-%m-%d %H:%M:%S')
+    except (ValueError, TypeError):
+        return None
+
+
+def convert_duration_to_seconds(duration_str):
+    if pd.isnull(duration_str):
+        return None
+    match = re.match(r"(?:(\d+)\s*Min)?(?:\s*&\s*)?(?:(\d+)\s*Sec)?", duration_str)
+    if match:
+        minutes = int(match.group(1)) if match.group(1) else 0
+        seconds = int(match.group(2)) if match.group(2) else 0
+        return minutes * 60 + seconds
+    return None
+
+
+# The legacy path had no phone normalization; it gets the same per-cell function so both insert the same rows
+LEGACY_CONVERTERS = {'time': convert_time_to_string, 'duration': convert_duration_to_seconds, 'phone': normalize_phone}
+
+
+def sample_value(conversion, rng, i):
+    if conversion == 'time':
+        return f"{rng.choice(MONTHS)} {rng.randint(1, 28)}, {rng.randint(1, 12)}:{rng.randint(0, 59):02d} {rng.choice(['AM', 'PM'])}"
+    if conversion == 'duration':
+        return f"{rng.randint(0, 59)} Min & {rng.randint(0, 59)} Sec"
+    if conversion == 'phone':
+        return f"+1 (555) {rng.randint(100, 999)}-{i % 997:04d}"
+    return f"value {i % 997}"
+
+
+def header(source):
+    return source if isinstance(source, str) else source[0]
+
+
+def sample_frame(table_name, rows, seed=0):
+    rng = random.Random(seed)
+    return pd.DataFrame({
+        header(source): [sample_value(conversion, rng, i) for i in range(rows)]
+        for _, source, conversion in ingest.TABLE_COLUMNS[table_name]
+    })
+
+
+# The per-row loop process_and_insert used before the bulk engine
+def legacy_insert(conn, df, table_name):
+    cursor = conn.cursor()
+    sql = ingest.insert_statement(table_name)
+    for _, row in df.iterrows():
+        cursor.execute(sql, tuple(
+            LEGACY_CONVERTERS[conversion](row[header(source)]) if conversion else row[header(source)]
+            for _, source, conversion in ingest.TABLE_COLUMNS[table_name]
+        ))
+    conn.commit()
+
+
+def bulk_insert(conn, df, table_name):
+    ingest.insert_dataframe(conn, df, table_name)
+
+
+def measure(insert, df, table_name):
+    conn = sqlite3.connect(':memory:')
+    schema.migrate(conn)
+    start = time.perf_counter()
+    insert(conn, df, table_name)
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return len(df) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare row-by-row and bulk ingestion throughput per table.')
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--tables', nargs='*', default=list(ingest.TABLE_COLUMNS))
+    args = parser.parse_args()
+
+    print(f"{'table':<15}{'before rows/s':>15}{'after rows/s':>15}{'speedup':>10}")
+    for table_name in args.tables:
+        df = sample_frame(table_name, args.rows)
+        before = measure(legacy_insert, df, table_name)
+        after = measure(bulk_insert, df, table_name)
+        print(f"{table_name:<15}{before:>15,.0f}{after:>15,.0f}{after / before:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
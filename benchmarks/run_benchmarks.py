@@ -0,0 +1,260 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import api
+import avatars
+import conversations
+import db
+import generate_data
+import ingest
+import paging
+import schema
+import search
+import views
+from converters import ConversionErrors
+
+# Times ingest, search, paged reads and first-screen page builds against a seeded synthetic
+# dataset and writes the numbers as JSON. With --baseline, metrics that got worse by more than
+# --tolerance are listed and the exit status is 1, so runs on two versions can be compared.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+def timings(fn, repeat):
+    # Milliseconds per call: median, 95th percentile and worst of `repeat` calls
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {'p50_ms': round(statistics.median(samples), 3), 'p95_ms': round(percentile(samples, 0.95), 3),
+            'max_ms': round(max(samples), 3)}
+
+
+def search_terms(seed, count):
+    # Single words, prefixes and two-word phrases from the generator's vocabulary
+    rng = random.Random(seed)
+    terms = []
+    for index in range(count):
+        word = rng.choice(generate_data.WORDS)
+        if index % 3 == 1:
+            terms.append(word[:max(2, len(word) - 2)])
+        elif index % 3 == 2:
+            terms.append(f'"{word} {rng.choice(generate_data.WORDS)}"')
+        else:
+            terms.append(word)
+    return terms
+
+
+def bench_ingest(conn, paths, batch_size):
+    results = {}
+    for table_name, path in paths.items():
+        start = time.perf_counter()
+        parsed = inserted = 0
+        for parsed, inserted in ingest.insert_batches(conn, ingest.iter_frames(path, path, batch_size), table_name, ConversionErrors()):
+            pass
+        seconds = time.perf_counter() - start
+        results[table_name] = {'rows': parsed, 'inserted': inserted, 'seconds': round(seconds, 3),
+                               'rows_per_sec': round(parsed / seconds if seconds else 0.0, 1)}
+        print(f"ingest  {table_name:<15}{ingest.format_rate(parsed, seconds)}")
+    return results
+
+
+def bench_search(conn, tables, terms, repeat):
+    # FTS5 ranked search where a table is indexed, the LIKE fallback elsewhere
+    results = {}
+    for table_name in tables:
+        if search.is_indexed(conn, table_name):
+            def run():
+                for term in terms:
+                    search.search(conn, table_name, term, limit=paging.PAGE_SIZE + 1)
+        else:
+            def run():
+                for term in terms:
+                    paging.fetch_page(conn, table_name, search_term=term.strip('"'))
+        result = timings(run, repeat)
+        result = {key: round(value / len(terms), 3) for key, value in result.items()}
+        result['indexed'] = search.is_indexed(conn, table_name)
+        results[table_name] = result
+        print(f"search  {table_name:<15}{result['p50_ms']:>10.2f} ms/term")
+    return results
+
+
+def bench_paging(conn, tables, pages, repeat):
+    # Newest first by time: the first page, `pages` pages walked by cursor, and a page from the middle
+    results = {}
+    for table_name in tables:
+        time_column = ingest.time_column(table_name)
+        count = conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+        middle = conn.execute(f"SELECT {time_column}, rowid FROM {table_name} ORDER BY {time_column} DESC, rowid DESC LIMIT 1 OFFSET ?",
+                              (count // 2,)).fetchone()
+
+        def walk():
+            cursor = None
+            for _ in range(pages):
+                _, cursor = paging.fetch_page(conn, table_name, time_column, True, cursor)
+                if cursor is None:
+                    break
+
+        results[table_name] = {
+            'first_page': timings(lambda: paging.fetch_page(conn, table_name, time_column, True), repeat),
+            'walk': {key: round(value / pages, 3) for key, value in timings(walk, repeat).items()},
+            'middle_page': timings(lambda: paging.fetch_page(conn, table_name, time_column, True, tuple(middle) if middle else None), repeat),
+        }
+        print(f"paging  {table_name:<15}{results[table_name]['walk']['p50_ms']:>10.2f} ms/page")
+    return results
+
+
+def bench_render(conn, tables, repeat):
+    # Server-side work behind each first screen, down to the JSON sent to the browser. The page data
+    # comes from the same views functions the apps call; building the NiceGUI elements is not timed.
+    frequent = set(avatars.frequent_names(conn))
+
+    def table_view(table_name):
+        def build():
+            columns = paging.table_columns(conn, table_name)
+            rows, _ = views.table_page(conn, table_name, indexed=search.is_indexed(conn, table_name))
+            json.dumps({'columns': columns, 'rows': rows})
+        return build
+
+    def messages_view():
+        rows, _ = conversations.list_conversations(conn)
+        if rows:
+            conversations.fetch_messages(conn, rows[0]['counterpart'])
+        json.dumps(rows)
+
+    def list_view(page, *args):
+        return lambda: json.dumps(page(conn, None, *args)[0])
+
+    results = {f"table.{table_name}": timings(table_view(table_name), repeat) for table_name in tables}
+    results.update({f"api.{table_name}": timings(lambda: json.dumps(api.fetch_rows(conn, table_name)), repeat) for table_name in tables})
+    results['messages'] = timings(messages_view, repeat)
+    results['calls'] = timings(list_view(views.calls_page, frequent), repeat)
+    results['contacts'] = timings(list_view(views.contacts_page, frequent), repeat)
+    results['apps'] = timings(list_view(views.installed_apps_page), repeat)
+    results['keylogs'] = timings(list_view(views.keylogs_page), repeat)
+    results['dashboard'] = timings(lambda: json.dumps(views.dashboard(conn)), repeat)
+    for name, result in results.items():
+        print(f"render  {name:<25}{result['p50_ms']:>10.2f} ms")
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(results, prefix=''):
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix + key] = value
+    return flat
+
+
+def regressions(current, baseline, tolerance):
+    # (metric, baseline, current) for timings that grew or rates that fell by more than tolerance
+    worse = []
+    before, after = flatten(baseline['results']), flatten(current['results'])
+    for metric, old in before.items():
+        new = after.get(metric)
+        if new is None or not old:
+            continue
+        if metric.endswith('_ms') and new > old * (1 + tolerance):
+            worse.append((metric, old, new))
+        elif metric.endswith('per_sec') and new < old * (1 - tolerance):
+            worse.append((metric, old, new))
+    return worse
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark ingest, search, paging and page builds on synthetic data.')
+    parser.add_argument('--rows', type=int, default=1000000, help='rows per table')
+    parser.add_argument('--tables', nargs='*', default=list(ingest.TABLE_COLUMNS))
+    parser.add_argument('--format', choices=list(generate_data.WRITERS), default='csv')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data', help='directory for the generated exports (default: a temporary one)')
+    parser.add_argument('--batch-size', type=int, default=ingest.BATCH_SIZE)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--terms', type=int, default=20)
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--output', help=f'results file (default: {os.path.relpath(RESULTS_DIR, ROOT)}/<commit>-<rows>.json)')
+    parser.add_argument('--baseline', help='earlier results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown before a metric counts as a regression')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        data_dir = args.data or os.path.join(scratch, 'data')
+        paths = {table_name: os.path.join(data_dir, f"{table_name.lower()}.{args.format}") for table_name in args.tables}
+        missing = [table_name for table_name, path in paths.items() if not os.path.exists(path)]
+        if missing:
+            start = time.perf_counter()
+            generate_data.generate(data_dir, missing, args.rows, args.format, args.seed)
+            print(f"generated {len(missing)} exports of {args.rows:,} rows in {time.perf_counter() - start:.1f}s")
+
+        conn = db.connect(os.path.join(scratch, 'bench.db'))
+        schema.migrate(conn)
+        results = {'ingest': bench_ingest(conn, paths, args.batch_size)}
+        conn.execute('ANALYZE')
+        conn.commit()
+        results['search'] = bench_search(conn, args.tables, search_terms(args.seed, args.terms), args.repeat)
+        results['paging'] = bench_paging(conn, [table_name for table_name in args.tables if ingest.time_column(table_name)], args.pages, args.repeat)
+        results['render'] = bench_render(conn, args.tables, args.repeat)
+        conn.close()
+
+    commit = git_commit()
+    report = {
+        'commit': commit,
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'parameters': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline', 'data')},
+        'results': results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{(commit or 'unknown')[:10]}-{args.rows}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nresults written to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('parameters', {}).get('rows') != args.rows:
+            print(f"warning: baseline ran with {baseline.get('parameters', {}).get('rows')} rows per table, this run with {args.rows}")
+        worse = regressions(report, baseline, args.tolerance)
+        for metric, old, new in worse:
+            print(f"regression  {metric}: {old:,} -> {new:,}")
+        if worse:
+            return 1
+        print(f"no regressions beyond {args.tolerance:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+import db
+import paging
+from converters import normalize_phone
+
+# One row per counterpart in Messages, kept current by triggers so every ingest path
+# (both apps and process_files.py) updates it in the same transaction as the insert.
+# A message counts as unread until its conversation is opened after it arrived.
+CONVERSATION_PAGE = 50
+
+
+# Counterpart of a Messages row: first the raw from_to, then (schema version 6) its normalized
+# phone number so differently formatted numbers share one conversation
+FROM_TO_KEY = "IFNULL({row}.from_to, '')"
+PHONE_KEY = "COALESCE({row}.phone_norm, {row}.from_to, '')"
+
+
+def conversation_triggers(key):
+    new_key, old_key = key.format(row='new'), key.format(row='old')
+    return f'''
+        CREATE TRIGGER IF NOT EXISTS conversations_insert AFTER INSERT ON Messages BEGIN
+            INSERT INTO Conversations (counterpart, last_message, last_time, last_rowid, total_count, unread_count)
+            VALUES ({new_key}, new.message, new.time, new.rowid, 1, 1)
+            ON CONFLICT (counterpart) DO UPDATE SET
+                last_message = CASE WHEN IFNULL(new.time, '') >= IFNULL(last_time, '') THEN new.message ELSE last_message END,
+                last_rowid = CASE WHEN IFNULL(new.time, '') >= IFNULL(last_time, '') THEN new.rowid ELSE last_rowid END,
+                last_time = CASE WHEN IFNULL(new.time, '') >= IFNULL(last_time, '') THEN new.time ELSE last_time END,
+                total_count = total_count + 1,
+                unread_count = unread_count + (last_read_time IS NULL OR IFNULL(new.time, '') > last_read_time);
+        END;
+        CREATE TRIGGER IF NOT EXISTS conversations_delete AFTER DELETE ON Messages BEGIN
+            UPDATE Conversations SET
+                total_count = total_count - 1,
+                unread_count = MAX(0, unread_count - (last_read_time IS NULL OR IFNULL(old.time, '') > last_read_time))
+            WHERE counterpart = {old_key};
+        END;
+    '''
+
+
+def create_conversation_summary(conn):
+    db.execute_script(conn, '''
+        CREATE TABLE IF NOT EXISTS Conversations (
+            counterpart TEXT PRIMARY KEY,
+            last_message TEXT,
+            last_time DATETIME,
+            last_rowid INTEGER,
+            total_count INTEGER NOT NULL DEFAULT 0,
+            unread_count INTEGER NOT NULL DEFAULT 0,
+            last_read_time DATETIME
+        );
+        CREATE INDEX IF NOT EXISTS idx_conversations_last_time ON Conversations (IFNULL(last_time, ''), counterpart);
+    ''' + conversation_triggers(FROM_TO_KEY) + '''
+        -- Existing messages: the bare columns come from the row holding MAX(time)
+        INSERT OR IGNORE INTO Conversations (counterpart, last_message, last_time, last_rowid, total_count, unread_count)
+        SELECT IFNULL(from_to, ''), message, MAX(IFNULL(time, '')), rowid, COUNT(*), COUNT(*)
+        FROM Messages GROUP BY IFNULL(from_to, '');
+        UPDATE Conversations SET last_time = NULL WHERE last_time = '';
+    ''')
+
+
+def rekey_by_phone(conn):
+    # Regroup conversations on the normalized number. Read marks carry over to the merged
+    # conversation (the earliest one wins), and unread counts are recomputed against them.
+    key = PHONE_KEY.format(row='m')
+    db.execute_script(conn, f'''
+        DROP TRIGGER IF EXISTS conversations_insert;
+        DROP TRIGGER IF EXISTS conversations_delete;
+        CREATE TEMP TABLE read_marks AS
+            SELECT COALESCE(normalize_phone(NULLIF(counterpart, '')), counterpart) AS counterpart, MIN(last_read_time) AS last_read_time
+            FROM Conversations WHERE last_read_time IS NOT NULL GROUP BY 1;
+        DELETE FROM Conversations;
+        INSERT INTO Conversations (counterpart, last_message, last_time, last_rowid, total_count, unread_count, last_read_time)
+        SELECT counterpart, message, MAX(IFNULL(time, '')), message_rowid, COUNT(*),
+               SUM(last_read_time IS NULL OR IFNULL(time, '') > last_read_time), last_read_time
+        FROM (
+            SELECT {key} AS counterpart, m.message, m.time, m.rowid AS message_rowid, r.last_read_time
+            FROM Messages m LEFT JOIN read_marks r ON r.counterpart = {key}
+        )
+        GROUP BY counterpart;
+        UPDATE Conversations SET last_time = NULL WHERE last_time = '';
+        DROP TABLE read_marks;
+    ''' + conversation_triggers(PHONE_KEY))
+
+
+def list_conversations(conn, cursor=None, limit=CONVERSATION_PAGE):
+    # Most recent conversation first, paged on (last_time, counterpart)
+    condition, params = '', []
+    if cursor is not None:
+        condition, params = "WHERE (IFNULL(last_time, ''), counterpart) < (?, ?)", list(cursor)
+    result = conn.execute(f'''
+        SELECT counterpart, last_message, last_time, total_count, unread_count,
+               (SELECT name FROM Contacts WHERE phone_norm = counterpart ORDER BY name LIMIT 1) AS contact_name
+        FROM Conversations {condition}
+        ORDER BY IFNULL(last_time, '') DESC, counterpart DESC
+        LIMIT ?
+    ''', params + [limit + 1])
+    names = [description[0] for description in result.description]
+    rows = [dict(zip(names, row)) for row in result.fetchall()]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = (rows[-1]['last_time'] or '', rows[-1]['counterpart'])
+    return rows, next_cursor
+
+
+def mark_read(conn, counterpart):
+    conn.execute('''
+        UPDATE Conversations SET unread_count = 0, last_read_time = IFNULL(last_time, '')
+        WHERE counterpart = ?
+    ''', (counterpart,))
+    conn.commit()
+
+
+def fetch_messages(conn, counterpart, cursor=None, limit=paging.PAGE_SIZE):
+    # Newest first. Counterparts are normalized numbers where from_to is a phone number, served by
+    # idx_messages_phone_norm_time; otherwise the raw from_to, where '' collects NULL from_to.
+    phone = normalize_phone(counterpart)
+    filters = {'phone_norm': phone} if phone else {'phone_norm': None, 'from_to': counterpart or None}
+    return paging.fetch_page(conn, 'Messages', 'time', True, cursor, filters=filters, limit=limit)
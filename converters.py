@@ -0,0 +1,151 @@
+import os
+import re
+from datetime import datetime
+
+import pandas as pd
+
+OUTPUT_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Formats seen in device exports. Values without a year get the column's year prepended first.
+TIME_FORMATS = [
+    '%Y %b %d, %I:%M %p',    # Jan 1, 10:00 AM
+    '%b %d %Y %I:%M %p',     # Jan 1 2023 10:00 AM
+    '%b %d, %Y %I:%M %p',    # Jan 1, 2023 10:00 AM
+    '%Y-%m-%d %H:%M:%S',     # 2023-10-07 14:30:00
+    '%Y-%m-%d %H:%M',
+    '%Y-%m-%d',
+]
+
+DURATION_PATTERN = r'^\s*(?:(?P<minutes>\d+)\s*Min)?(?:\s*&\s*)?(?:(?P<seconds>\d+)\s*Sec)?\s*$'
+
+# Phone numbers are stored alongside a canonical E.164-style form ('+15551234567') used for matching.
+# National numbers without a country code are assumed to belong to DEFAULT_COUNTRY_CODE.
+DEFAULT_COUNTRY_CODE = os.environ.get('DEFAULT_COUNTRY_CODE', '1')
+NATIONAL_NUMBER_DIGITS = 10
+PHONE_PATTERN = re.compile(r'\+?[\d\s().\-/]+')
+
+# Column name -> format that parsed it last time, tried first on the next upload
+_known_formats = {}
+
+
+class ConversionErrors:
+    def __init__(self, sample_size=3):
+        self.sample_size = sample_size
+        self.counts = {}
+        self.samples = {}
+
+    def record(self, column, invalid):
+        if invalid.empty:
+            return
+        self.counts[column] = self.counts.get(column, 0) + len(invalid)
+        samples = self.samples.setdefault(column, [])
+        for row, value in invalid.head(self.sample_size - len(samples)).items():
+            samples.append((row, value))
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+    def __bool__(self):
+        return bool(self.counts)
+
+    def summary(self):
+        parts = []
+        for column, count in self.counts.items():
+            examples = ', '.join(f"row {row}: {value!r}" for row, value in self.samples[column])
+            parts.append(f"{column}: {count} invalid (e.g. {examples})")
+        return 'Invalid values skipped - ' + '; '.join(parts)
+
+
+def infer_year(text):
+    years = text.str.extract(r'(\d{4})', expand=False).dropna()
+    return int(years.mode().iloc[0]) if not years.empty else datetime.now().year
+
+
+def convert_times(series, errors=None):
+    text = series.astype('string').str.strip()
+    present = text.notna() & (text != '')
+    text = text.where(present)
+
+    has_year = text.str.contains(r'\d{4}', na=False)
+    candidates = text.where(has_year, f"{infer_year(text)} " + text)
+
+    parsed = pd.Series(pd.NaT, index=series.index, dtype='datetime64[ns]')
+    remaining = present.copy()
+    known = _known_formats.get(series.name)
+    best_format, best_count = None, 0
+    for fmt in sorted(TIME_FORMATS, key=lambda fmt: fmt != known):
+        if not remaining.any():
+            break
+        attempt = pd.to_datetime(candidates[remaining], format=fmt, errors='coerce')
+        matched = attempt.index[attempt.notna()]
+        parsed[matched] = attempt[matched]
+        remaining[matched] = False
+        if len(matched) > best_count:
+            best_format, best_count = fmt, len(matched)
+    if best_format:
+        _known_formats[series.name] = best_format
+
+    if errors is not None:
+        errors.record(series.name, series[remaining])
+    return parsed.dt.strftime(OUTPUT_TIME_FORMAT).astype(object).where(parsed.notna(), None)
+
+
+def convert_durations(series, errors=None):
+    if pd.api.types.is_numeric_dtype(series):
+        # Spreadsheet cells come back as floats, not always whole (12.5); durations are rounded to the
+        # nearest second. Infinities cannot be stored, so they are recorded and nulled like bad text.
+        numbers = series.astype('float64')
+        valid = numbers.notna() & ~numbers.isin([float('inf'), float('-inf')])
+        if errors is not None:
+            errors.record(series.name, series[numbers.notna() & ~valid])
+        return numbers.where(valid).round().astype('Int64').astype(object).where(valid, None)
+
+    text = series.astype('string')
+    present = text.notna() & (text.str.strip() != '')
+    parts = text.str.extract(DURATION_PATTERN)
+    plain = pd.to_numeric(text.where(text.str.fullmatch(r'\s*\d+(?:\.\d+)?\s*', na=False)), errors='coerce').round()
+    matched = (parts['minutes'].notna() | parts['seconds'].notna() | plain.notna()) & present
+
+    seconds = (
+        pd.to_numeric(parts['minutes'], errors='coerce').fillna(0) * 60
+        + pd.to_numeric(parts['seconds'], errors='coerce').fillna(0)
+    )
+    seconds = seconds.where(plain.isna(), plain).astype('Int64')
+
+    if errors is not None:
+        errors.record(series.name, series[present & ~matched])
+    return seconds.astype(object).where(matched, None)
+
+
+def normalize_phone(value):
+    # '+1 (555) 123-4567', '555-123-4567' and '0015551234567' all become '+15551234567'.
+    # Text that is not a phone number (such as a name) gives None; short codes keep their digits.
+    if value is None:
+        return None
+    if isinstance(value, float):
+        if value != value or not value.is_integer():
+            return None
+        value = int(value)
+    text = str(value).strip()
+    if not PHONE_PATTERN.fullmatch(text):
+        return None
+    digits = re.sub(r'\D', '', text)
+    if not digits:
+        return None
+    if text.startswith('+'):
+        return '+' + digits
+    if digits.startswith('00'):
+        return '+' + digits[2:]
+    if len(digits) == NATIONAL_NUMBER_DIGITS:
+        return '+' + DEFAULT_COUNTRY_CODE + digits
+    if len(digits) == NATIONAL_NUMBER_DIGITS + len(DEFAULT_COUNTRY_CODE) and digits.startswith(DEFAULT_COUNTRY_CODE):
+        return '+' + digits
+    return digits
+
+
+def convert_phones(series, errors=None):
+    # Not a validation: counterparts that are names simply have no normalized number.
+    # Exports repeat the same few numbers, so each distinct value is normalized once.
+    mapping = {value: normalize_phone(value) for value in series.dropna().unique()}
+    return series.map(mapping).astype(object).where(series.notna(), None)
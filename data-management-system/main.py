@@ -1,14 +1,26 @@
-import sqlite3
-import pandas as pd
-from nicegui import ui
-from datetime import datetime
-from typing import List, Dict, Any
-import re
-import json
-from io import BytesIO
+from nicegui import ui, app, run
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import PlainTextResponse
 from pathlib import Path
+import hashlib
 import tempfile
 import os
+import sys
+
+# Shared ingestion modules live in the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import avatars
+import conversations
+import db
+import ingest
+import jobs
+import metrics
+import paging
+import rollups
+import schema
+import views
+from converters import ConversionErrors
 
 column_sets = {
     'Calls': {'call_type', 'time', 'from_to', 'duration', 'location'},
@@ -20,133 +32,190 @@ column_sets = {
 
 # Database configuration
 DATABASE_FILE = 'data.db'
-
-# Utility Functions
-def convert_time_to_string(time_str):
+# Every query helper borrows a tuned connection from this pool instead of reconnecting
+pool = db.ConnectionPool(DATABASE_FILE, size=int(os.environ.get('DB_POOL_SIZE', db.POOL_SIZE)))
+app.on_shutdown(pool.close)
+
+# Uploads run as background jobs, at most IMPORT_WORKERS at a time
+import_jobs = jobs.JobQueue(int(os.environ.get('IMPORT_WORKERS', jobs.IMPORT_WORKERS)))
+app.on_shutdown(import_jobs.stop)
+
+@app.get('/stats/pool')
+def pool_stats():
+    return pool.stats()
+
+@app.get('/stats/jobs')
+def job_stats():
+    return {**import_jobs.stats(), 'jobs': import_jobs.recent()}
+
+# Stage latency histograms and row counts, in the Prometheus text format
+@app.get('/metrics')
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type='text/plain; version=0.0.4')
+
+# Rollups answer from the precomputed tables, e.g. /api/rollups/CallRollup?period=week&group_by=contact
+@app.get('/api/rollups/{table_name}')
+def rollup_summary(table_name: str, period: str = None, group_by: str = '', since: str = None, until: str = None,
+                   order_by: str = None, limit: int = 100):
     try:
-        year_match = re.search(r"(\d{4})", time_str)
-        year = year_match.group(1) if year_match else datetime.now().year
-        return datetime.strptime(f"{year} {time_str}", '%Y %b %d, %I:%M %p').strftime('%Y-%m-%d %H:%M:%S')
-    except (ValueError, TypeError):
-        ui.notify(f"Invalid time format: {time_str}", type='error')
-        return None
-
-def convert_duration_to_seconds(duration_str):
-    if pd.isnull(duration_str):
-        return None
-    match = re.match(r"(?:(\d+)\s*Min)?(?:\s*&\s*)?(?:(\d+)\s*Sec)?", duration_str)
-    if match:
-        minutes = int(match.group(1)) if match.group(1) else 0
-        seconds = int(match.group(2)) if match.group(2) else 0
-        return minutes * 60 + seconds
-    else:
-        ui.notify(f"Invalid duration format: {duration_str}", type='error')
-        return None
-
-def validate_required_columns(df, required_columns):
-    if not set(required_columns).issubset(df.columns):
-        missing_columns = set(required_columns) - set(df.columns)
-        ui.notify(f"Missing columns: {', '.join(missing_columns)}", type='error')
-        return False
-    return True
+        with pool.connection() as conn:
+            return rollups.summary(conn, table_name, period, [key for key in group_by.split(',') if key],
+                                   since, until, order_by=order_by, limit=min(limit, 10000))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get('/api/rollups/CallDurationHistogram/percentiles')
+def call_duration_percentiles(call_type: str = None):
+    with pool.connection() as conn:
+        return rollups.duration_percentiles(conn, call_type)
+
+# Avatars are generated here rather than requested from an external service
+@app.get(avatars.ROUTE + '/{color}/{letters}.svg')
+def avatar(color: int, letters: str, request: Request):
+    if not 0 <= color < len(avatars.PALETTE) or len(letters) > 2:
+        return Response(status_code=404)
+    svg, etag = avatars.render(letters, color)
+    headers = {'ETag': etag, 'Cache-Control': avatars.CACHE_CONTROL}
+    if request.headers.get('if-none-match') == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(svg, media_type='image/svg+xml', headers=headers)
+
+# The busiest contacts' avatars are inlined so the first screen needs no avatar requests
+frequent_avatars = set()
+
+def load_frequent_avatars():
+    with pool.connection() as conn:
+        frequent_avatars.clear()
+        frequent_avatars.update(avatars.frequent_names(conn))
+
+app.on_startup(load_frequent_avatars)
 
 # Table Creation
 def create_tables():
-    with sqlite3.connect(DATABASE_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS Calls (
-                call_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                call_type TEXT,
-                time DATETIME,
-                from_to TEXT,
-                duration_sec INTEGER,
-                location TEXT
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS Messages (
-                message_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                message_type TEXT,
-                time DATETIME,
-                from_to TEXT,
-                message TEXT
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS Contacts (
-                contact_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT,
-                phone_number TEXT,
-                email TEXT
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS InstalledApps (
-                app_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                app_name TEXT,
-                package_name TEXT,
-                install_date DATETIME
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS Keylogs (
-                keylog_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                application TEXT,
-                time DATETIME,
-                text TEXT
-            )
-        ''')
-        conn.commit()
+    with pool.connection() as conn:
+        schema.migrate(conn)
     ui.notify('Tables created successfully!', type='positive')
 
 # Data Insertion
-def insert_data(table_name, df):
-    placeholders = ', '.join(['?' for _ in df.columns])
+def insert_batch(table_name, df, errors):
+    with pool.connection() as conn:
+        return ingest.insert_dataframe(conn, df, table_name, errors)
+
+async def insert_data(job, path, table_name, digest):
+    # Runs as a background job: parsing and inserting happen off the event loop, one committed batch at a time.
+    # The job owns the spooled upload at path: it opens it only once it runs and deletes it when done.
     try:
-        with sqlite3.connect(DATABASE_FILE) as conn:
-            cursor = conn.cursor()
-            cursor.executemany(f"INSERT INTO {table_name} VALUES (NULL, {placeholders})", df.values.tolist())
-            conn.commit()
-        ui.notify(f"Data inserted into '{table_name}' successfully.", type='positive')
-    except Exception as e:
-        ui.notify(f"Error inserting data: {e}", type='error')
+        with open(path, 'rb') as source:
+            frames = ingest.iter_frames(source, job.file_name)
+            try:
+                job.check_cancelled()
+                errors = ConversionErrors()
+                with metrics.stage('parse', table=table_name):
+                    df = await run.io_bound(next, frames, None)
+                while df is not None:
+                    job.check_cancelled()
+                    job.rows_inserted += await run.io_bound(insert_batch, table_name, df, errors)
+                    job.rows_parsed += len(df)
+                    job.errors = errors.summary() if errors else None
+                    job.error_count = errors.total
+                    with metrics.stage('parse', table=table_name):
+                        df = await run.io_bound(next, frames, None)
+            finally:
+                frames.close()
+        with pool.connection() as conn:
+            ingest.record_import(conn, digest, job.file_name, table_name, job.rows_parsed, job.rows_inserted)
+        job.message = f"Inserted {job.rows_inserted:,} new of {ingest.format_rate(job.rows_parsed, job.run_seconds)} into '{table_name}'."
+    finally:
+        os.unlink(path)
 
 # File processing and insertion
-def process_and_insert(uploaded_file):
+async def spool_upload(uploaded_file):
+    # Copy the upload to a temporary file on disk, hashing it on the way for the import ledger.
+    # A queued job then holds only the path, not the upload's bytes or an open stream.
+    digest = hashlib.sha256()
+    spooled = tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(uploaded_file.name)[1])
     try:
-        file_content = uploaded_file.content
-        file_name = uploaded_file.name
-
-        if file_name.endswith('.xlsx'):
-            df = pd.read_excel(BytesIO(file_content))
-        elif file_name.endswith('.csv'):
-            df = pd.read_csv(BytesIO(file_content))
-        else:
+        with spooled:
+            async for block in uploaded_file.iterate(chunk_size=1 << 20):
+                digest.update(block)
+                await run.io_bound(spooled.write, block)
+    except BaseException:
+        os.unlink(spooled.name)
+        raise
+    return spooled.name, digest.hexdigest()
+
+def read_header(path, file_name):
+    with open(path, 'rb') as source:
+        return ingest.read_header(source, file_name)
+
+async def process_and_insert(e):
+    path = None
+    try:
+        file_name = e.file.name
+
+        if not file_name.endswith(('.xlsx', '.csv')):
             ui.notify("Unsupported file format. Please upload CSV or Excel files.", type='negative')
             return None
 
-        headers = set(df.columns)
-        table_name = next((table for table, columns in column_sets.items() if columns.issubset(headers)), None)
+        with metrics.stage('spool'):
+            path, digest = await spool_upload(e.file)
 
+        # Route the file from its header row alone; unrecognized files never have their body parsed
+        with metrics.stage('read_header'):
+            headers = set(await run.io_bound(read_header, path, file_name))
+        with metrics.stage('identify_table'):
+            table_name = next((table for table, columns in column_sets.items() if columns.issubset(headers)), None)
         if table_name is None:
             ui.notify("Unable to determine the appropriate table for this file.", type='negative')
             return None
 
-        insert_data(table_name, df)
-        ui.notify(f"File processed and data inserted into {table_name} table.", type='positive')
-        return table_name
-    except Exception as e:
-        ui.notify(f"Error processing file: {str(e)}", type='negative')
+        # Identical files are skipped before parsing anything
+        with pool.connection() as conn:
+            if ingest.is_imported(conn, digest):
+                ui.notify(f"{file_name} was already imported; skipped.", type='info')
+                return None
+
+        # The job parses the spooled file in batches once it runs; from here on it owns the file
+        job = import_jobs.submit(file_name, lambda job, path=path: insert_data(job, path, table_name, digest))
+        job.table_name = table_name
+        path = None
+        return job
+    except Exception as ex:
+        ui.notify(f"Error processing file: {str(ex)}", type='negative')
         return None
+    finally:
+        if path is not None:
+            os.unlink(path)
 
 def get_avatar(name):
-    return f"https://ui-avatars.com/api/?name={name}&background=random&color=fff&font-size=0.5"
+    return avatars.image(name, frequent_avatars)
+
+def job_status():
+    with ui.label().classes('text-xs') as label:
+        # Which values were skipped as invalid, for the running or latest job
+        tooltip = ui.tooltip()
+
+    def refresh():
+        stats = import_jobs.stats()
+        recent = import_jobs.recent()
+        # Progress of a running import, otherwise how the latest one ended
+        job = next((job for job in recent if job['status'] == 'running'), next(iter(recent), None))
+        text = f"{stats['running']} importing, {stats['queued']} queued" if stats['running'] or stats['queued'] else ''
+        if job and job['status'] == 'running':
+            text += f" - #{job['id']}: {job['rows_parsed']:,} rows at {job['rows_per_sec']:,.0f} rows/s, {job['error_count']:,} invalid"
+        elif job and job['status'] in ('done', 'failed', 'cancelled'):
+            text = f"#{job['id']} {job['status']}: {job['message']} ({job['rows_per_sec']:,.0f} rows/s, {job['error_count']:,} invalid)"
+        label.text = text
+        tooltip.text = (job or {}).get('errors') or ''
+        tooltip.set_visibility(bool(tooltip.text))
+
+    ui.timer(1.0, refresh)
 
 def show_data(active_tab='Messages'):
     with ui.column().classes('w-full h-full main-content'):
         with ui.row().classes('w-full justify-between items-center p-4 bg-blue-500 text-white'):
             ui.label('Data View').classes('text-xl font-bold')
+            job_status()
             ui.button(icon='add', on_click=lambda: ui.upload(on_upload=process_and_notify).classes('w-full')).classes('bg-white text-blue-500 rounded-full')
 
         with ui.tabs().classes('w-full') as tabs:
@@ -155,129 +224,272 @@ def show_data(active_tab='Messages'):
             ui.tab('Contacts', icon='contacts').classes('text-sm')
             ui.tab('Apps', icon='apps').classes('text-sm')
             ui.tab('Keylogs', icon='keyboard').classes('text-sm')
+            ui.tab('Dashboard', icon='insights').classes('text-sm')
+
+        # A panel is rendered the first time its tab is opened and kept for the rest of the session
+        with ui.tab_panels(tabs, value=active_tab).classes('w-full flex-grow') as tab_panels:
+            panels = {name: ui.tab_panel(name) for name in TAB_CONTENT}
+        loaded = set()
 
-        with ui.tab_panels(tabs, value=active_tab).classes('w-full flex-grow'):
-            with ui.tab_panel('Messages'):
-                display_messages()
-            with ui.tab_panel('Calls'):
-                display_calls()
-            with ui.tab_panel('Contacts'):
-                display_contacts()
-            with ui.tab_panel('Apps'):
-                display_apps()
-            with ui.tab_panel('Keylogs'):
-                display_keylogs()
+        def load_tab(name):
+            if name in panels and name not in loaded:
+                loaded.add(name)
+                with panels[name], metrics.stage('render', name=name):
+                    TAB_CONTENT[name]()
+
+        tab_panels.on_value_change(lambda e: load_tab(e.value))
+        load_tab(active_tab)
 
         ui.input(placeholder='Search conversations...').classes('fixed bottom-4 left-4 right-4 bg-white rounded-full p-2')
 
 def display_messages():
-    messages = get_all_messages()
-    contacts = {contact['phone_number']: contact['name'] for contact in get_contacts()}
-    grouped_messages = {}
-
-    for message in messages:
-        contact = contacts.get(message['from_to'], message['from_to'])
-        if contact not in grouped_messages:
-            grouped_messages[contact] = []
-        grouped_messages[contact].append(message)
-
-    for contact, msgs in grouped_messages.items():
-        with ui.expansion(contact).classes('w-full mb-2'):
-            for message in msgs:
+    # Renders from the Conversations summary; a conversation's messages are only queried when it is opened
+    state = {'cursor': None, 'done': False}
+
+    def load_conversations():
+        if state['done']:
+            return
+        rows, state['cursor'] = get_conversations(state['cursor'])
+        state['done'] = state['cursor'] is None
+        with container:
+            for conversation in rows:
+                display_conversation(conversation, conversation['contact_name'] or conversation['counterpart'])
+
+    # The next page is fetched as the list is scrolled near its end
+    with ui.scroll_area(on_scroll=lambda e: load_conversations() if e.vertical_percentage > 0.9 else None).classes('w-full').style('height: calc(100vh - 200px)'):
+        container = ui.column().classes('w-full')
+    load_conversations()
+
+def display_conversation(conversation, contact):
+    counterpart = conversation['counterpart']
+    caption = f"{conversation['total_count']} messages"
+    if conversation['unread_count']:
+        caption += f", {conversation['unread_count']} unread"
+    caption += f" · {conversation['last_time'] or ''} {conversation['last_message'] or ''}"
+    state = {'cursor': None, 'loaded': False}
+
+    def load_page():
+        rows, state['cursor'] = get_conversation_messages(counterpart, state['cursor'])
+        with messages:
+            for message in rows:
                 with ui.card().classes('w-full mb-2 p-2'):
                     with ui.row().classes('items-center'):
-                        ui.avatar(get_avatar(contact)).classes('mr-2')
+                        # ui.avatar takes an icon name; the img: prefix makes it show the picture at that URL
+                        ui.avatar('img:' + get_avatar(contact)).classes('mr-2')
                         with ui.column():
                             ui.label(contact).classes('font-bold')
                             ui.label(message['time']).classes('text-xs text-gray-500')
                     ui.label(message['message']).classes('mt-2 text-sm chat-bubble')
+        older.set_visibility(state['cursor'] is not None)
+
+    def opened(e):
+        if e.value and not state['loaded']:
+            state['loaded'] = True
+            load_page()
+            mark_conversation_read(counterpart)
+
+    with ui.expansion(contact, caption=caption, on_value_change=opened).classes('w-full mb-2'):
+        messages = ui.column().classes('w-full')
+        older = ui.button('Older messages', on_click=load_page).props('flat dense')
+        older.set_visibility(False)
+
+# Pages of rows an infinite list holds at once; the browser is sent at most this window
+LIST_WINDOW_PAGES = 4
+
+def infinite_list(fetch, template, item_size=96):
+    # q-virtual-scroll keeps only the cards in view in the DOM; fetch(cursor) returns a keyset
+    # page as (rows, next_cursor). The list holds a window of LIST_WINDOW_PAGES pages: scrolling
+    # near its end fetches the next page and drops the first, scrolling near its start fetches
+    # the page before again from its saved cursor, so each update sends a bounded number of rows.
+    # cursors[i] starts page i; sizes are the row counts of the pages from `first` on.
+    state = {'cursors': [None], 'first': 0, 'sizes': [], 'items': []}
+    scroll = ui.element('q-virtual-scroll').classes('w-full').style('max-height: calc(100vh - 200px)')
+    scroll.props(f'virtual-scroll-item-size={item_size}')
+    scroll.add_slot('default', template)
+
+    def fetch_page(page):
+        rows, next_cursor = fetch(state['cursors'][page])
+        if page + 1 == len(state['cursors']):
+            state['cursors'].append(next_cursor)
+        return rows
+
+    def show(items, first_visible=None):
+        with metrics.stage('render', name=fetch.__name__):
+            state['items'] = items
+            # props is observed, so assigning a new list sends it to the browser
+            scroll.props['items'] = items
+            if first_visible is not None:
+                # Keeps the cards the user was looking at in place after rows left the window
+                scroll.run_method('scrollTo', max(first_visible, 0), 'start-force')
+
+    def load_next(first_visible=None):
+        page = state['first'] + len(state['sizes'])
+        # Page 0 starts at cursor None; any later page without a cursor is past the end
+        if page > 0 and state['cursors'][page] is None:
+            return
+        rows = fetch_page(page)
+        items, dropped = state['items'] + rows, 0
+        state['sizes'].append(len(rows))
+        if len(state['sizes']) > LIST_WINDOW_PAGES:
+            dropped = state['sizes'].pop(0)
+            state['first'] += 1
+            items = items[dropped:]
+        show(items, first_visible - dropped if dropped and first_visible is not None else None)
+
+    def load_previous(first_visible):
+        if state['first'] == 0:
+            return
+        state['first'] -= 1
+        rows = fetch_page(state['first'])
+        items = rows + state['items']
+        state['sizes'].insert(0, len(rows))
+        if len(state['sizes']) > LIST_WINDOW_PAGES:
+            items = items[:len(items) - state['sizes'].pop()]
+        show(items, first_visible + len(rows))
+
+    def scrolled(e):
+        start, end = e.args.get('from', 0), e.args.get('to', 0)
+        if end >= len(state['items']) - paging.PAGE_SIZE // 2:
+            load_next(start)
+        elif start < paging.PAGE_SIZE // 2:
+            load_previous(start)
+
+    scroll.on('virtual-scroll', scrolled, ['from', 'to'])
+    load_next()
 
 def display_calls():
-    calls = get_calls()
-    contacts = {contact['phone_number']: contact['name'] for contact in get_contacts()}
-
-    with ui.column().classes('w-full').style('max-height: calc(100vh - 200px); overflow-y: auto;'):
-        for call in calls:
-            with ui.card().classes('w-full mb-2 p-2'):
-                with ui.row().classes('items-center'):
-                    ui.avatar(get_avatar(contacts.get(call['from_to'], call['from_to']))).classes('mr-2')
-                    with ui.column():
-                        ui.label(contacts.get(call['from_to'], call['from_to'])).classes('font-bold')
-                        ui.label(f"{call['call_type']} - {call['time']}").classes('text-xs text-gray-500')
-                ui.label(f"Duration: {call['duration_sec']} seconds").classes('mt-2 text-sm')
+    infinite_list(get_calls, '''
+        <q-card class="w-full mb-2 p-2">
+            <div class="row items-center">
+                <q-avatar class="mr-2"><img :src="props.item.avatar"></q-avatar>
+                <div class="column">
+                    <div class="font-bold">{{ props.item.contact }}</div>
+                    <div class="text-xs text-gray-500">{{ props.item.call_type }} - {{ props.item.time }}</div>
+                </div>
+            </div>
+            <div class="mt-2 text-sm">Duration: {{ props.item.duration_sec }} seconds</div>
+        </q-card>
+    ''')
 
 def display_contacts():
-    contacts = get_contacts()
-    with ui.column().classes('w-full').style('max-height: calc(100vh - 200px); overflow-y: auto;'):
-        for contact in contacts:
-            with ui.card().classes('w-full mb-2 p-2'):
-                with ui.row().classes('items-center'):
-                    ui.avatar(get_avatar(contact['name'])).classes('mr-2')
-                    with ui.column():
-                        ui.label(contact['name']).classes('font-bold')
-                        ui.label(contact.get('phone_number', '')).classes('text-sm')
-                        ui.label(contact.get('email', '')).classes('text-sm')
+    infinite_list(get_contacts, '''
+        <q-card class="w-full mb-2 p-2">
+            <div class="row items-center">
+                <q-avatar class="mr-2"><img :src="props.item.avatar"></q-avatar>
+                <div class="column">
+                    <div class="font-bold">{{ props.item.name }}</div>
+                    <div class="text-sm">{{ props.item.phone_number }}</div>
+                    <div class="text-sm">{{ props.item.email }}</div>
+                </div>
+            </div>
+        </q-card>
+    ''')
 
 def display_apps():
-    apps = get_installed_apps()
-    with ui.column().classes('w-full').style('max-height: calc(100vh - 200px); overflow-y: auto;'):
-        for app in apps:
-            with ui.card().classes('w-full mb-2 p-2'):
-                ui.label(app['app_name']).classes('text-base font-bold')
-                ui.label(app['package_name']).classes('text-sm')
-                ui.label(app['install_date']).classes('text-sm text-gray-500')
+    infinite_list(get_installed_apps, '''
+        <q-card class="w-full mb-2 p-2">
+            <div class="text-base font-bold">{{ props.item.app_name }}</div>
+            <div class="text-sm">{{ props.item.package_name }}</div>
+            <div class="text-sm text-gray-500">{{ props.item.install_date }}</div>
+        </q-card>
+    ''', item_size=88)
 
 def display_keylogs():
-    keylogs = get_keylogs()
+    infinite_list(get_keylogs, '''
+        <q-card class="w-full mb-2 p-2">
+            <div class="text-sm text-gray-500">{{ props.item.application }} - {{ props.item.time }}</div>
+            <div class="text-base">{{ props.item.text }}</div>
+        </q-card>
+    ''', item_size=72)
+
+def display_dashboard():
+    data = get_dashboard()
     with ui.column().classes('w-full').style('max-height: calc(100vh - 200px); overflow-y: auto;'):
-        for keylog in keylogs:
-            with ui.card().classes('w-full mb-2 p-2'):
-                ui.label(f"{keylog['application']} - {keylog['time']}").classes('text-sm text-gray-500')
-                ui.label(keylog['text']).classes('text-base')
-
-def get_all_messages():
-    with sqlite3.connect(DATABASE_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM Messages ORDER BY time DESC LIMIT 100")
-        messages = [dict(zip([column[0] for column in cursor.description], row)) for row in cursor.fetchall()]
-    return messages
-
-def get_calls():
-    with sqlite3.connect(DATABASE_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM Calls ORDER BY time DESC LIMIT 100")
-        calls = [dict(zip([column[0] for column in cursor.description], row)) for row in cursor.fetchall()]
-    return calls
-
-def get_contacts():
-    with sqlite3.connect(DATABASE_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM Contacts")
-        contacts = [dict(zip([column[0] for column in cursor.description], row)) for row in cursor.fetchall()]
-    return contacts
-
-def get_installed_apps():
-    with sqlite3.connect(DATABASE_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM InstalledApps ORDER BY install_date DESC")
-        apps = [dict(zip([column[0] for column in cursor.description], row)) for row in cursor.fetchall()]
-    return apps
-
-def get_keylogs():
-    with sqlite3.connect(DATABASE_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM Keylogs ORDER BY time DESC LIMIT 100")
-        keylogs = [dict(zip([column[0] for column in cursor.description], row)) for row in cursor.fetchall()]
-    return keylogs
-
-def process_and_notify(e):
-    table_name = process_and_insert(e)
-    if table_name:
-        show_data(table_name)
+        with ui.card().classes('w-full mb-2 p-2'):
+            ui.label('Calls by type').classes('text-base font-bold')
+            ui.table(columns=[
+                {'name': 'call_type', 'label': 'Type', 'field': 'call_type', 'align': 'left'},
+                {'name': 'calls', 'label': 'Calls', 'field': 'calls'},
+                {'name': 'minutes', 'label': 'Minutes', 'field': 'minutes'},
+                {'name': 'p50', 'label': 'Median ≤ s', 'field': 'p50'},
+                {'name': 'p90', 'label': 'p90 ≤ s', 'field': 'p90'},
+            ], rows=data['call_types'], row_key='call_type').classes('w-full').props('flat dense')
+
+        with ui.card().classes('w-full mb-2 p-2'):
+            ui.label('Top contacts by call minutes').classes('text-base font-bold')
+            ui.table(columns=[
+                {'name': 'name', 'label': 'Contact', 'field': 'name', 'align': 'left'},
+                {'name': 'calls', 'label': 'Calls', 'field': 'calls'},
+                {'name': 'minutes', 'label': 'Minutes', 'field': 'minutes'},
+            ], rows=data['top_contacts'], row_key='contact').classes('w-full').props('flat dense')
+
+        with ui.card().classes('w-full mb-2 p-2'):
+            ui.label('Messages per day').classes('text-base font-bold')
+            ui.echart({
+                'xAxis': {'type': 'category', 'data': [row['period_start'] for row in data['messages_per_day']]},
+                'yAxis': {'type': 'value'},
+                'series': [{'type': 'bar', 'data': [row['messages'] for row in data['messages_per_day']]}],
+            }).classes('w-full h-64')
+
+        with ui.card().classes('w-full mb-2 p-2'):
+            ui.label('Keylog volume by application').classes('text-base font-bold')
+            ui.table(columns=[
+                {'name': 'application', 'label': 'Application', 'field': 'application', 'align': 'left'},
+                {'name': 'entries', 'label': 'Entries', 'field': 'entries'},
+                {'name': 'characters', 'label': 'Characters', 'field': 'characters'},
+            ], rows=data['keylogs'], row_key='application').classes('w-full').props('flat dense')
+
+TAB_CONTENT = {
+    'Messages': display_messages,
+    'Calls': display_calls,
+    'Contacts': display_contacts,
+    'Apps': display_apps,
+    'Keylogs': display_keylogs,
+    'Dashboard': display_dashboard,
+}
+
+def get_conversations(cursor=None):
+    with pool.connection() as conn, metrics.query(conn, 'get_conversations'):
+        return conversations.list_conversations(conn, cursor)
+
+def get_conversation_messages(counterpart, cursor=None):
+    with pool.connection() as conn, metrics.query(conn, 'get_conversation_messages'):
+        return conversations.fetch_messages(conn, counterpart, cursor)
+
+def mark_conversation_read(counterpart):
+    with pool.connection() as conn, metrics.query(conn, 'mark_conversation_read'):
+        conversations.mark_read(conn, counterpart)
+
+# Each helper returns one keyset page, newest first, as (rows, next_cursor)
+def get_calls(cursor=None):
+    with pool.connection() as conn, metrics.query(conn, 'get_calls'):
+        return views.calls_page(conn, cursor, frequent_avatars)
+
+def get_contacts(cursor=None):
+    with pool.connection() as conn, metrics.query(conn, 'get_contacts'):
+        return views.contacts_page(conn, cursor, frequent_avatars)
+
+def get_installed_apps(cursor=None):
+    with pool.connection() as conn, metrics.query(conn, 'get_installed_apps'):
+        return views.installed_apps_page(conn, cursor)
+
+def get_keylogs(cursor=None):
+    with pool.connection() as conn, metrics.query(conn, 'get_keylogs'):
+        return views.keylogs_page(conn, cursor)
+
+def get_dashboard():
+    with pool.connection() as conn, metrics.query(conn, 'get_dashboard'):
+        return views.dashboard(conn)
+
+async def process_and_notify(e):
+    job = await process_and_insert(e)
+    if job:
+        ui.notify(f"{job.file_name} queued as import #{job.id} into {job.table_name}.", type='info')
 
 def main():
     create_tables()
-    show_data()
+    # A page per client, so tab contents are loaded and cached per session
+    ui.page('/')(show_data)
     ui.run(port=8080, title='Data Management System')
 
 if __name__ in {"__main__", "__mp_main__"}:
@@ -295,4 +507,4 @@ ui.add_body_html("""
     word-wrap: break-word;
 }
 </style>
-""")
+""", shared=True)
@@ -0,0 +1,183 @@
+import asyncio
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+
+READER_THREADS = 4
+POOL_SIZE = 4
+# Prepared statements kept per connection (sqlite3 defaults to 128)
+CACHED_STATEMENTS = 512
+
+PRAGMAS = {
+    # WAL lets readers keep serving pages while the writer commits
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -65536,        # KiB, i.e. 64 MiB of page cache
+    'mmap_size': 268435456,      # 256 MiB memory-mapped I/O
+    'temp_store': 'MEMORY',
+}
+
+
+def execute_script(conn, script):
+    # Runs the statements of script one at a time in the caller's transaction, where
+    # executescript() would commit first. Statements are split at the semicolons that end them;
+    # sqlite3.complete_statement skips those inside strings and trigger bodies.
+    statement = ''
+    for part in script.split(';'):
+        statement += part + ';'
+        if sqlite3.complete_statement(statement):
+            if statement.strip('; \n\t'):
+                conn.execute(statement)
+            statement = ''
+
+
+def connect(database_file, check_same_thread=True):
+    conn = sqlite3.connect(database_file, timeout=30, check_same_thread=check_same_thread,
+                           cached_statements=CACHED_STATEMENTS)
+    for pragma, value in PRAGMAS.items():
+        conn.execute(f'PRAGMA {pragma}={value}')
+    return conn
+
+
+class ConnectionPool:
+    # Hands out up to `size` long-lived connections; callers wait when all are checked out
+    def __init__(self, database_file, size=POOL_SIZE):
+        self.database_file = database_file
+        self.size = size
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+        self.created = 0
+        self.in_use = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def acquire(self, timeout=None):
+        start = time.perf_counter()
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                create = self.created < self.size
+                if create:
+                    self.created += 1
+            if create:
+                conn = connect(self.database_file, check_same_thread=False)
+            else:
+                conn = self.idle.get(timeout=timeout)
+                with self.lock:
+                    self.waits += 1
+        waited = time.perf_counter() - start
+        with self.lock:
+            self.in_use += 1
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+        return conn
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        with self.lock:
+            self.in_use -= 1
+        self.idle.put(conn)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        # Commits on success and rolls back on error, like `with sqlite3.connect(...)`
+        conn = self.acquire(timeout)
+        try:
+            with conn:
+                yield conn
+        finally:
+            self.release(conn)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'size': self.size,
+                'open': self.created,
+                'in_use': self.in_use,
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'wait_avg_ms': self.wait_total / self.checkouts * 1000 if self.checkouts else 0.0,
+                'wait_max_ms': self.wait_max * 1000,
+            }
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class Database:
+    # Reads run on a pool of threads with one connection each; all writes go through a
+    # queue drained by a single writer task that owns the only writing connection.
+    def __init__(self, database_file, readers=READER_THREADS):
+        self.database_file = database_file
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+        self.reader_pool = ThreadPoolExecutor(max_workers=readers, thread_name_prefix='db-reader')
+        self.writer_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+        self.queue = None
+        self.writer = None
+
+    def connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.local.conn = connect(self.database_file, check_same_thread=False)
+            with self.lock:
+                self.connections.append(conn)
+        return conn
+
+    def call(self, fn, args, kwargs):
+        return fn(self.connection(), *args, **kwargs)
+
+    async def read(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.reader_pool, partial(self.call, fn, args, kwargs))
+
+    async def write(self, fn, *args, **kwargs):
+        if self.writer is None:
+            self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((fn, args, kwargs, future))
+        return await future
+
+    async def write_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            fn, args, kwargs, future = await self.queue.get()
+            try:
+                result = await loop.run_in_executor(self.writer_pool, partial(self.call, fn, args, kwargs))
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
+            finally:
+                self.queue.task_done()
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        self.writer = asyncio.create_task(self.write_loop())
+
+    async def close(self):
+        if self.writer:
+            await self.queue.join()
+            self.writer.cancel()
+        self.reader_pool.shutdown(wait=True)
+        self.writer_pool.shutdown(wait=True)
+        with self.lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections.clear()
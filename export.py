@@ -0,0 +1,157 @@
+import csv
+import io
+import zlib
+
+import db
+import ingest
+import paging
+import search
+
+# Rows fetched per fetchmany() call and written per CSV chunk / Parquet row group
+EXPORT_BATCH = 10000
+
+# format -> (media type, file extension)
+FORMATS = {
+    'csv': ('text/csv', '.csv'),
+    'csv.gz': ('application/gzip', '.csv.gz'),
+    'parquet': ('application/vnd.apache.parquet', '.parquet'),
+}
+
+
+def export_query(conn, table_name, term=None, since=None, until=None):
+    # Rows of the table in storage order, optionally narrowed to a search term and a time range
+    if table_name not in ingest.TABLE_COLUMNS:
+        raise ValueError(f"Unknown table: {table_name}")
+    columns = paging.table_columns(conn, table_name)
+    conditions, params = [], []
+    if term:
+        if search.is_indexed(conn, table_name):
+            match = search.fts_query(term)
+            # A term of only punctuation leaves nothing to MATCH, which FTS5 rejects mid-stream
+            if not match:
+                raise ValueError(f"Search term has no words: {term!r}")
+            fts = f"{table_name}_fts"
+            conditions.append(f"rowid IN (SELECT rowid FROM {fts} WHERE {fts} MATCH ?)")
+            params.append(match)
+        else:
+            conditions.append('(' + ' OR '.join(f"{column} LIKE ?" for column in columns) + ')')
+            params.extend(f"%{term}%" for _ in columns)
+    time_column = ingest.time_column(table_name)
+    if (since or until) and time_column is None:
+        raise ValueError(f"{table_name} has no time column")
+    since, until = ingest.time_range(since, until)
+    if since:
+        conditions.append(f"{time_column} >= ?")
+        params.append(since)
+    if until:
+        conditions.append(f"{time_column} <= ?")
+        params.append(until)
+    query = f"SELECT * FROM {table_name}"
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    return query + ' ORDER BY rowid', params
+
+
+def iter_batches(database_file, table_name, term=None, since=None, until=None, batch_size=EXPORT_BATCH):
+    # Yields (column names, rows) batches from one read transaction on a dedicated connection.
+    # The query is prepared before the first yield so bad arguments fail before any bytes are sent.
+    conn = db.connect(database_file, check_same_thread=False)
+    try:
+        query, params = export_query(conn, table_name, term, since, until)
+        cursor = conn.execute(query, params)
+    except Exception:
+        conn.close()
+        raise
+
+    def batches():
+        try:
+            yield from cursor_batches(conn, cursor, table_name, batch_size)
+        finally:
+            conn.close()
+    return batches()
+
+
+def cursor_batches(conn, cursor, table_name, batch_size=EXPORT_BATCH):
+    # (column names, declared types, rows) for an executed SELECT * over table_name; the first
+    # batch is empty so writers can emit their header before anything is fetched
+    names = [description[0] for description in cursor.description]
+    declared = {row[1]: row[2].upper() for row in conn.execute(f"PRAGMA table_info({table_name})")}
+    yield names, declared, []
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        yield names, declared, rows
+
+
+def iter_csv(batches):
+    for names, _, rows in batches:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if not rows:
+            writer.writerow(names)
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+
+
+def iter_gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class _ChunkSink(io.RawIOBase):
+    # Write-only file handed to ParquetWriter; whatever it has written is collected between row groups
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def take(self):
+        data, self.chunks = b''.join(self.chunks), []
+        return data
+
+
+def iter_parquet(batches):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink, writer = _ChunkSink(), None
+    for names, declared, rows in batches:
+        if writer is None:
+            schema = pa.schema([(name, pa.int64() if declared.get(name) == 'INTEGER' else pa.string()) for name in names])
+            writer = pq.ParquetWriter(sink, schema, compression='snappy')
+        if rows:
+            # One row group per batch; the bytes are sent as soon as it is written
+            columns = [[row[index] for row in rows] for index in range(len(names))]
+            columns = [column if field.type == pa.int64() else [None if value is None else str(value) for value in column]
+                       for column, field in zip(columns, schema)]
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+        data = sink.take()
+        if data:
+            yield data
+    writer.close()
+    yield sink.take()
+
+
+def stream(database_file, table_name, export_format='csv', term=None, since=None, until=None):
+    if export_format not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    batches = iter_batches(database_file, table_name, term, since, until)
+    if export_format == 'parquet':
+        return iter_parquet(batches)
+    chunks = iter_csv(batches)
+    return iter_gzip(chunks) if export_format == 'csv.gz' else chunks
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+
+import paging
+
+# Change feed for open table views. Each watched table has a rowid high-water mark; when the
+# table's write version moves, the rows past the mark are read once and handed to every
+# subscriber as "rows first..last added", so views append the delta instead of re-querying.
+# Versions come from versions.VersionCache, so imports in other server processes and
+# process_files.py are picked up by polling; imports in this process wake the feed at once.
+FEED_INTERVAL = 0.5
+# Rows sent with each event; a view never shows more than a page of them
+FEED_ROWS = paging.PAGE_SIZE
+
+log = logging.getLogger(__name__)
+
+
+def high_water_mark(conn, table_name):
+    return conn.execute(f"SELECT IFNULL(MAX(rowid), 0) FROM {table_name}").fetchone()[0]
+
+
+def fetch_delta(conn, table_name, after, limit=FEED_ROWS):
+    # (last rowid, rows added after `after`, first `limit` of those rows)
+    last = high_water_mark(conn, table_name)
+    if last <= after:
+        return last, 0, []
+    count = conn.execute(f"SELECT COUNT(*) FROM {table_name} WHERE rowid > ? AND rowid <= ?", (after, last)).fetchone()[0]
+    result = conn.execute(f'''
+        SELECT rowid AS _rowid, * FROM {table_name}
+        WHERE rowid > ? AND rowid <= ? ORDER BY rowid LIMIT ?
+    ''', (after, last, limit))
+    names = [description[0] for description in result.description]
+    return last, count, [dict(zip(names, row)) for row in result.fetchall()]
+
+
+class ChangeFeed:
+    def __init__(self, database, versions, interval=FEED_INTERVAL):
+        self.database = database
+        self.versions = versions
+        self.interval = interval
+        self.marks = {}
+        self.seen = {}
+        self.subscribers = {}
+        self.wakeup = None
+        self.task = None
+
+    async def subscribe(self, table_name, callback):
+        # callback(first rowid, last rowid, count, rows) runs on the event loop for every batch
+        # of rows added after this call; returns the function that unsubscribes it
+        if table_name not in self.marks:
+            self.seen[table_name] = await asyncio.to_thread(self.versions.get, table_name)
+            self.marks[table_name] = await self.database.read(high_water_mark, table_name)
+        self.subscribers.setdefault(table_name, set()).add(callback)
+
+        def unsubscribe():
+            callbacks = self.subscribers.get(table_name)
+            if callbacks is None:
+                return
+            callbacks.discard(callback)
+            if not callbacks:
+                # Nobody watches the table any more; a later subscriber starts from a fresh mark
+                del self.subscribers[table_name]
+                self.marks.pop(table_name, None)
+                self.seen.pop(table_name, None)
+        return unsubscribe
+
+    def notify(self):
+        # Called after a write in this process so subscribers do not wait for the next poll
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    def start(self):
+        self.wakeup = asyncio.Event()
+        self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+
+    def current_versions(self, tables):
+        # Runs in a worker thread and touches nothing but the VersionCache
+        return {table_name: self.versions.get(table_name) for table_name in tables}
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            try:
+                # Subscriptions change on the loop, so the watched tables are listed here, not in the thread
+                tables = list(self.subscribers)
+                for table_name, version in (await asyncio.to_thread(self.current_versions, tables)).items():
+                    if table_name in self.seen and version != self.seen[table_name]:
+                        self.seen[table_name] = version
+                        await self.publish(table_name)
+            except Exception:
+                log.exception('change feed poll failed')
+
+    async def publish(self, table_name):
+        after = self.marks.get(table_name)
+        if after is None:
+            return
+        last, count, rows = await self.database.read(fetch_delta, table_name, after)
+        if table_name not in self.marks:
+            return
+        self.marks[table_name] = max(after, last)
+        if not count:
+            return
+        for callback in list(self.subscribers.get(table_name, ())):
+            try:
+                callback(after + 1, last, count, rows)
+            except Exception:
+                log.exception('change feed subscriber failed')
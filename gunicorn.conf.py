@@ -0,0 +1,21 @@
+import multiprocessing
+import os
+
+import db
+import schema
+
+# gunicorn asgi:server   (this file is picked up from the working directory)
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+worker_class = 'uvicorn.workers.UvicornWorker'
+# Readers run in parallel under WAL, so read throughput scales with one worker per core;
+# writes from all workers still take turns on SQLite's single write lock
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+# Each worker imports the app itself, so nothing opened at import time is shared across the fork
+preload_app = False
+
+
+def on_starting(server):
+    # Migrate once in the master, before any worker opens the database
+    conn = db.connect(os.environ.get('DATABASE_FILE', 'data.db'))
+    schema.migrate(conn)
+    conn.close()
@@ -0,0 +1,273 @@
+import csv
+import hashlib
+import io
+import os
+import re
+import zipfile
+
+import pandas as pd
+from openpyxl import load_workbook
+
+import metrics
+import rollups
+import versions
+from converters import convert_durations, convert_phones, convert_times
+
+# Rows parsed and committed per batch when streaming an upload
+BATCH_SIZE = 50000
+# Uploads are held in memory up to this size and spill to a temporary file beyond it
+SPOOL_THRESHOLD = 8 << 20
+# Longest CSV header line read when sniffing an upload
+HEADER_LIMIT = 64 << 10
+
+# Pads a partial time to the last moment it covers; day 31 sorts after every real day of a month
+LATEST_TIME = '9999-12-31 23:59:59'
+
+# Column layout for each table: (database column, source column(s), conversion).
+# A tuple of source columns lists alternative headers used by different exports.
+# phone_norm is derived from the table's phone column rather than read from the file.
+TABLE_COLUMNS = {
+    'Calls': [
+        ('call_type', 'call_type', None),
+        ('time', 'time', 'time'),
+        ('from_to', 'from_to', None),
+        ('duration_sec', ('duration_sec', 'duration'), 'duration'),
+        ('location', 'location', None),
+        ('phone_norm', 'from_to', 'phone'),
+    ],
+    'Messenger': [
+        ('contact_name', 'contact_name', None),
+        ('message_time', 'message_time', 'time'),
+        ('message_text', 'message_text', None),
+    ],
+    'SMS': [
+        ('phone_number', 'phone_number', None),
+        ('message_time', 'message_time', 'time'),
+        ('message_text', 'message_text', None),
+        ('location', 'location', None),
+        ('phone_norm', 'phone_number', 'phone'),
+    ],
+    'Messages': [
+        ('message_type', 'message_type', None),
+        ('time', 'time', 'time'),
+        ('from_to', 'from_to', None),
+        ('message', 'message', None),
+        ('phone_norm', 'from_to', 'phone'),
+    ],
+    'Contacts': [
+        ('name', 'name', None),
+        ('phone_number', 'phone_number', None),
+        ('email', 'email', None),
+        ('phone_norm', 'phone_number', 'phone'),
+    ],
+    'InstalledApps': [
+        ('app_name', 'app_name', None),
+        ('package_name', 'package_name', None),
+        ('install_date', 'install_date', 'time'),
+    ],
+    'Keylogs': [
+        ('application', 'application', None),
+        ('time', 'time', 'time'),
+        ('text', 'text', None),
+    ],
+}
+
+CONVERTERS = {'time': convert_times, 'duration': convert_durations, 'phone': convert_phones}
+
+
+def source_column(df, source):
+    if isinstance(source, str):
+        return df[source]
+    return df[next(column for column in source if column in df.columns)]
+
+
+def insert_statement(table_name):
+    # Rows already present under the table's natural key (schema.NATURAL_KEYS) are skipped
+    columns = [column for column, _, _ in TABLE_COLUMNS[table_name]]
+    placeholders = ', '.join('?' for _ in columns)
+    return f"INSERT OR IGNORE INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders})"
+
+
+def column_values(series):
+    # NaN/NaT become NULL; tolist() hands back plain Python scalars sqlite3 can bind
+    return series.astype(object).where(series.notna(), None).tolist()
+
+
+def build_rows(df, table_name, errors=None):
+    columns = []
+    with metrics.stage('convert', table=table_name):
+        for _, source, conversion in TABLE_COLUMNS[table_name]:
+            series = source_column(df, source)
+            if conversion:
+                series = CONVERTERS[conversion](series, errors)
+            columns.append(column_values(series))
+        return list(zip(*columns))
+
+
+def without_archived(conn, table_name, rows):
+    # Months moved to Parquet by archive.py are closed. Their rows have left the natural-key index,
+    # so a re-imported copy would be stored, counted by the rollups and returned by archive.query
+    # twice; rows timed in an archived month are dropped instead. Rows without a time are kept.
+    months = {row[0] for row in conn.execute('SELECT DISTINCT month FROM ArchivePartitions WHERE table_name = ?', (table_name,))}
+    if not months:
+        return rows
+    position = [column for column, _, _ in TABLE_COLUMNS[table_name]].index(time_column(table_name))
+    kept = [row for row in rows if row[position] is None or row[position][:7] not in months]
+    metrics.count('rows', len(rows) - len(kept), stage='archived', table=table_name)
+    return kept
+
+
+def bulk_insert(conn, table_name, rows):
+    cursor = conn.cursor()
+    if not conn.in_transaction:
+        # IMMEDIATE takes the write lock up front, so concurrent writers wait out the busy timeout;
+        # a deferred BEGIN would read first and then fail at once trying to upgrade to a write
+        cursor.execute('BEGIN IMMEDIATE')
+    try:
+        rows = without_archived(conn, table_name, rows)
+        # Rows inserted below get rowids above the current maximum (the tables are AUTOINCREMENT)
+        after = conn.execute(f"SELECT IFNULL(MAX(rowid), 0) FROM {table_name}").fetchone()[0]
+        # Includes the trigger writes (search indexes, conversations) each row sets off
+        with metrics.stage('insert', table=table_name):
+            cursor.executemany(insert_statement(table_name), rows)
+        with metrics.stage('rollup', table=table_name):
+            rollups.add_rows(conn, table_name, 'rowid > ?', (after,))
+        if cursor.rowcount > 0:
+            versions.bump(conn, table_name)
+    except Exception:
+        conn.rollback()
+        raise
+    with metrics.stage('commit', table=table_name):
+        conn.commit()
+    # rowcount counts only the rows actually inserted, not ignored duplicates or trigger writes
+    metrics.count('rows', cursor.rowcount, stage='inserted', table=table_name)
+    return cursor.rowcount
+
+
+def insert_dataframe(conn, df, table_name, errors=None):
+    metrics.count('rows', len(df), stage='parsed', table=table_name)
+    return bulk_insert(conn, table_name, build_rows(df, table_name, errors))
+
+
+def iter_excel_frames(source, batch_size=BATCH_SIZE):
+    # read_only mode streams rows from the sheet XML instead of building the whole workbook
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        start = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == batch_size:
+                yield pd.DataFrame(batch, columns=header, index=range(start, start + len(batch)))
+                start += len(batch)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=header, index=range(start, start + len(batch)))
+    finally:
+        workbook.close()
+
+
+def iter_frames(source, file_name, batch_size=BATCH_SIZE):
+    extension = os.path.splitext(file_name)[1].lower()
+    if extension == '.csv':
+        with pd.read_csv(source, chunksize=batch_size) as reader:
+            yield from reader
+    elif extension == '.xlsx':
+        yield from iter_excel_frames(source, batch_size)
+    else:
+        raise ValueError(f"Unsupported file format: {file_name}")
+
+
+def read_header(source, file_name):
+    # Column names from the first row only, so an upload can be routed (or rejected) before its
+    # body is parsed. The stream is left at the position it was found in.
+    extension = os.path.splitext(file_name)[1].lower()
+    position = source.tell()
+    try:
+        if extension == '.csv':
+            line = source.readline(HEADER_LIMIT)
+            try:
+                text = line.decode('utf-8-sig')
+            except UnicodeDecodeError:
+                raise ValueError(f"{file_name} is not a UTF-8 CSV file")
+            header = next(csv.reader(io.StringIO(text)), [])
+        elif extension == '.xlsx':
+            try:
+                workbook = load_workbook(source, read_only=True, data_only=True)
+            except (zipfile.BadZipFile, KeyError, OSError) as e:
+                raise ValueError(f"{file_name} is not a valid Excel workbook: {e}")
+            try:
+                header = next(workbook.active.iter_rows(max_row=1, values_only=True), ())
+            finally:
+                workbook.close()
+        else:
+            raise ValueError(f"Unsupported file format: {file_name}")
+    finally:
+        source.seek(position)
+    header = [str(column) for column in header if column not in (None, '')]
+    if not header:
+        raise ValueError(f"{file_name} has no header row")
+    return header
+
+
+def insert_batches(conn, frames, table_name, errors=None):
+    # Each batch is committed on its own so memory stays bounded by BATCH_SIZE.
+    # Yields running (rows parsed, rows inserted) totals.
+    parsed = inserted = 0
+    for frame in frames:
+        inserted += insert_dataframe(conn, frame, table_name, errors)
+        parsed += len(frame)
+        yield parsed, inserted
+
+
+def format_rate(rows, seconds):
+    return f"{rows:,} rows ({rows / seconds if seconds else 0:,.0f} rows/s)"
+
+
+# Import ledger: files are identified by a hash of their bytes so identical uploads are skipped
+def file_digest(fileobj, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    for block in iter(lambda: fileobj.read(chunk_size), b''):
+        digest.update(block)
+    return digest.hexdigest()
+
+
+def is_imported(conn, digest):
+    return conn.execute('SELECT 1 FROM ImportLedger WHERE content_hash = ?', (digest,)).fetchone() is not None
+
+
+def record_import(conn, digest, file_name, table_name, parsed, inserted):
+    conn.execute('''
+        INSERT OR REPLACE INTO ImportLedger (content_hash, file_name, table_name, rows_parsed, rows_inserted)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (digest, file_name, table_name, parsed, inserted))
+    conn.commit()
+
+
+def time_column(table_name):
+    # The table's event time column, the first one converted as a time
+    return next((column for column, _, conversion in TABLE_COLUMNS.get(table_name, []) if conversion == 'time'), None)
+
+
+def time_range(since, until):
+    # Inclusive bounds on stored times ('YYYY-MM-DD HH:MM:SS'). A shorter until such as a bare date
+    # covers every time it is a prefix of, so until=2024-01-31 includes that whole day.
+    if until and len(until) < len(LATEST_TIME) and re.fullmatch(r'\d{4}(-\d\d(-\d\d( \d\d(:\d\d)?)?)?)?', until):
+        until += LATEST_TIME[len(until):]
+    return since, until
+
+
+def identify_table(columns):
+    # First table whose source columns are all present; used where no app column_sets apply
+    columns = set(columns)
+    for table_name, layout in TABLE_COLUMNS.items():
+        if all(
+            source in columns if isinstance(source, str) else any(alternative in columns for alternative in source)
+            for _, source, _ in layout
+        ):
+            return table_name
+    return None
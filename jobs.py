@@ -0,0 +1,141 @@
+import asyncio
+import itertools
+import time
+from collections import OrderedDict
+
+IMPORT_WORKERS = 2
+# Finished jobs kept for the job table
+HISTORY = 200
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = 'queued', 'running', 'done', 'failed', 'cancelled'
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, job_id, file_name, run):
+        self.id = job_id
+        self.file_name = file_name
+        self.run = run
+        self.status = QUEUED
+        self.table_name = None
+        self.rows_parsed = 0
+        self.rows_inserted = 0
+        # errors is the ConversionErrors summary, error_count the number of values it covers
+        self.errors = None
+        self.error_count = 0
+        self.message = ''
+        self.cancel_requested = False
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def check_cancelled(self):
+        # Called by the job body between batches; committed batches are kept
+        if self.cancel_requested:
+            raise JobCancelled()
+
+    @property
+    def wait_seconds(self):
+        return (self.started_at or time.time()) - self.created_at
+
+    @property
+    def run_seconds(self):
+        return ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0.0
+
+    @property
+    def rows_per_sec(self):
+        return self.rows_parsed / self.run_seconds if self.run_seconds else 0.0
+
+    def as_dict(self):
+        return {
+            'id': self.id,
+            'file_name': self.file_name,
+            'table_name': self.table_name,
+            'status': self.status,
+            'rows_parsed': self.rows_parsed,
+            'rows_inserted': self.rows_inserted,
+            'rows_per_sec': round(self.rows_per_sec, 1),
+            'errors': self.errors,
+            'error_count': self.error_count,
+            'message': self.message,
+            'wait_seconds': round(self.wait_seconds, 2),
+            'run_seconds': round(self.run_seconds, 2),
+        }
+
+
+class JobQueue:
+    # Uploads are queued and return at once; `workers` tasks run at most that many imports at a time
+    def __init__(self, workers=IMPORT_WORKERS):
+        self.workers = workers
+        self.jobs = OrderedDict()
+        self.queue = None
+        self.tasks = []
+        self.ids = itertools.count(1)
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        self.tasks = [asyncio.create_task(self.work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+
+    def submit(self, file_name, run):
+        # run(job) is a coroutine function that does the import and updates the job's counters.
+        # It should call job.check_cancelled() first: a job cancelled while queued is still run
+        # so the body can clean up, and stops at that first check.
+        if not self.tasks:
+            self.start()
+        job = Job(next(self.ids), file_name, run)
+        self.jobs[job.id] = job
+        self.queue.put_nowait(job)
+        self.trim()
+        return job
+
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if job and job.status in (QUEUED, RUNNING):
+            job.cancel_requested = True
+            if job.status == QUEUED:
+                job.status = CANCELLED
+                job.finished_at = time.time()
+
+    async def work(self):
+        while True:
+            job = await self.queue.get()
+            if job.status == QUEUED:
+                job.status = RUNNING
+                job.started_at = time.time()
+            try:
+                await job.run(job)
+                job.status = DONE
+            except JobCancelled:
+                job.status = CANCELLED
+                job.message = 'Cancelled'
+            except Exception as e:
+                job.status = FAILED
+                job.message = str(e)
+            finally:
+                job.finished_at = job.finished_at or time.time()
+
+    def trim(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished_at]
+        for job_id in finished[:max(0, len(finished) - HISTORY)]:
+            del self.jobs[job_id]
+
+    def stats(self):
+        finished = [job for job in self.jobs.values() if job.status in (DONE, FAILED, CANCELLED) and job.started_at]
+        return {
+            'queued': sum(job.status == QUEUED for job in self.jobs.values()),
+            'running': sum(job.status == RUNNING for job in self.jobs.values()),
+            'workers': self.workers,
+            'avg_wait_seconds': round(sum(job.wait_seconds for job in finished) / len(finished), 2) if finished else 0.0,
+            'avg_run_seconds': round(sum(job.run_seconds for job in finished) / len(finished), 2) if finished else 0.0,
+        }
+
+    def recent(self, limit=20):
+        return [job.as_dict() for job in reversed(list(self.jobs.values())[-limit:])]
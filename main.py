@@ -1,11 +1,24 @@
-from nicegui import ui, app
-import pandas as pd
-import sqlite3
-from datetime import datetime
-import re
+from nicegui import ui, app, run
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 import os
-from werkzeug.utils import secure_filename
+import hashlib
 import tempfile
+from urllib.parse import urlencode
+
+import api
+import db
+import export
+import feed
+import ingest
+import jobs
+import metrics
+import paging
+import schema
+import search
+import versions
+import views
+from converters import ConversionErrors
 
 # Define column_sets before the process_and_insert function
 column_sets = {
@@ -17,199 +30,206 @@ column_sets = {
     'Keylogs': {'application', 'time', 'text'}
 }
 
-# Add this line after the imports
-PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
-
 # Database Connection
-DATABASE_FILE = 'data.db'
-conn = sqlite3.connect(DATABASE_FILE)
-cursor = conn.cursor()
+DATABASE_FILE = os.environ.get('DATABASE_FILE', 'data.db')
+# Page and upload handlers await this instead of touching SQLite on the event loop
+database = db.Database(DATABASE_FILE)
+app.on_startup(database.start)
+app.on_shutdown(database.close)
+# Uploads run as background jobs, at most IMPORT_WORKERS at a time
+import_jobs = jobs.JobQueue(int(os.environ.get('IMPORT_WORKERS', jobs.IMPORT_WORKERS)))
+app.on_shutdown(import_jobs.stop)
 
-# Utility Functions
-def convert_time_to_string(time_str):
+# Streams a table, search result or time range, e.g. /export/SMS?format=csv.gz&q=invoice&since=2024-01-01
+@app.get('/export/{table_name}')
+def export_table(table_name: str, format: str = 'csv', q: str = None, since: str = None, until: str = None):
+    if table_name not in ingest.TABLE_COLUMNS:
+        raise HTTPException(status_code=404, detail=f"Unknown table: {table_name}")
     try:
-        year_match = re.search(r"(\d{4})", time_str)
-        year = year_match.group(1) if year_match else datetime.now().year
-        return datetime.strptime(f"{year} {time_str}", '%Y %b %d, %I:%M %p').strftime('%Y-%m-%d %H:%M:%S')
-    except (ValueError, TypeError):
-        ui.notify(f"Invalid time format: {time_str}", type='error')
-        return None
-
-def convert_duration_to_seconds(duration_str):
-    if pd.isnull(duration_str):
-        return None
-    match = re.match(r"(?:(\d+)\s*Min)?(?:\s*&\s*)?(?:(\d+)\s*Sec)?", duration_str)
-    if match:
-        minutes = int(match.group(1)) if match.group(1) else 0
-        seconds = int(match.group(2)) if match.group(2) else 0
-        return minutes * 60 + seconds
-    else:
-        ui.notify(f"Invalid duration format: {duration_str}", type='error')
-        return None
-
-def validate_required_columns(df, required_columns):
-    if not set(required_columns).issubset(df.columns):
-        missing_columns = set(required_columns) - set(df.columns)
-        ui.notify(f"Missing columns: {', '.join(missing_columns)}", type='error')
-        return False
-    return True
+        chunks = export.stream(DATABASE_FILE, table_name, format, q, since, until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    media_type, extension = export.FORMATS[format]
+    return StreamingResponse(chunks, media_type=media_type,
+                             headers={'Content-Disposition': f'attachment; filename="{table_name}{extension}"'})
 
-# Table Creation
-def create_tables():
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS Calls (
-            call_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            call_type TEXT,
-            time DATETIME,
-            from_to TEXT,
-            duration_sec INTEGER,
-            location TEXT
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS Messenger (
-            message_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            contact_name TEXT,
-            message_time DATETIME,
-            message_text TEXT
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS SMS (
-            sms_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            phone_number TEXT,
-            message_time DATETIME,
-            message_text TEXT,
-            location TEXT
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS Contacts (
-            contact_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT,
-            phone_number TEXT,
-            email TEXT
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS InstalledApps (
-            app_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            app_name TEXT,
-            package_name TEXT,
-            install_date DATETIME
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS Keylogs (
-            keylog_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            application TEXT,
-            time DATETIME,
-            text TEXT
-        )
-    ''')
-    conn.commit()
-    ui.notify('Tables created successfully!', type='positive')
+# Read-only JSON API over the column_sets tables, e.g.
+# /api/v1/tables/Calls?fields=time,from_to&since=2024-01-01&sort=time&order=desc&limit=200
+# The ETag comes from the table's write version, so a poll with If-None-Match is answered
+# with 304 before any query runs
+table_versions = versions.VersionCache(DATABASE_FILE)
+app.on_shutdown(table_versions.close)
+# Rows added by any import, in this process or another, are pushed to the open table views
+change_feed = feed.ChangeFeed(database, table_versions)
+app.on_startup(change_feed.start)
+app.on_shutdown(change_feed.stop)
 
-def process_and_insert(file: ui.UploadFile):
-    try:
-        # Create a temporary file with a secure filename in the project directory
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(secure_filename(file.filename))[1], dir=PROJECT_DIR) as temp_file:
-            temp_file.write(file.content.read())
-            temp_file_path = temp_file.name
+@app.get('/api/v1/tables')
+async def api_tables():
+    return {
+        'version': api.API_VERSION,
+        'tables': [{'name': table_name, 'version': await run.io_bound(table_versions.get, table_name)} for table_name in column_sets],
+    }
 
-        # Identify the table based on the file contents
-        df = pd.read_csv(temp_file_path) if temp_file_path.endswith('.csv') else pd.read_excel(temp_file_path)
+@app.get('/api/v1/tables/{table_name}')
+async def api_table(table_name: str, request: Request, fields: str = None, since: str = None, until: str = None,
+                    sort: str = None, order: str = 'asc', cursor: str = None, limit: int = paging.PAGE_SIZE):
+    if table_name not in column_sets:
+        raise HTTPException(status_code=404, detail=f"Unknown table: {table_name}")
+    if order not in ('asc', 'desc'):
+        raise HTTPException(status_code=400, detail="order must be asc or desc")
+    # Read before the query: a write landing in between only makes the next poll refetch
+    version = await run.io_bound(table_versions.get, table_name)
+    tag = api.etag(table_name, version, dict(request.query_params))
+    headers = {'ETag': tag, 'Cache-Control': 'no-cache'}
+    if api.etag_matches(request.headers.get('if-none-match'), tag):
+        return Response(status_code=304, headers=headers)
+    # Another client's identical request at the same version is answered from this process's cache
+    body = table_versions.cached(tag)
+    if body is None:
+        try:
+            rows = await database.read(api.fetch_rows, table_name, [field for field in fields.split(',') if field] if fields else None,
+                                       since, until, sort, order == 'desc', cursor, limit)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        body = JSONResponse(rows).body
+        table_versions.store(tag, table_name, version, body)
+    return Response(body, media_type='application/json', headers=headers)
 
-        table_name = identify_table(df)
-        if not table_name:
-            ui.notify('Unable to identify the table for this data.', type='negative')
-            return
+@app.get('/stats/cache')
+def cache_stats():
+    return table_versions.stats()
 
-        # Rename the file based on the identified table
-        new_filename = f"{table_name.lower()}_{datetime.now().strftime('%Y%m%d_%H%M%S')}{os.path.splitext(file.filename)[1]}"
-        new_file_path = os.path.join(PROJECT_DIR, new_filename)
-        os.rename(temp_file_path, new_file_path)
+# Stage latency histograms and row counts for this process, in the Prometheus text format
+@app.get('/metrics')
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type='text/plain; version=0.0.4')
 
-        # Validate required columns
-        if not validate_required_columns(df, column_sets[table_name]):
-            return
+# Table Creation
+def create_tables():
+    conn = db.connect(DATABASE_FILE)
+    schema.migrate(conn)
+    conn.close()
+    ui.notify('Tables created successfully!', type='positive')
 
-        # Insert data into the appropriate table
-        for _, row in df.iterrows():
-            if table_name == 'Calls':
-                cursor.execute('''
-                    INSERT INTO Calls (call_type, time, from_to, duration_sec, location)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (
-                    row['call_type'],
-                    convert_time_to_string(row['time']),
-                    row['from_to'],
-                    convert_duration_to_seconds(row['duration_sec']),
-                    row['location']
-                ))
-            elif table_name == 'Messenger':
-                cursor.execute('''
-                    INSERT INTO Messenger (contact_name, message_time, message_text)
-                    VALUES (?, ?, ?)
-                ''', (
-                    row['contact_name'],
-                    convert_time_to_string(row['message_time']),
-                    row['message_text']
-                ))
-            elif table_name == 'SMS':
-                cursor.execute('''
-                    INSERT INTO SMS (phone_number, message_time, message_text, location)
-                    VALUES (?, ?, ?, ?)
-                ''', (
-                    row['phone_number'],
-                    convert_time_to_string(row['message_time']),
-                    row['message_text'],
-                    row['location']
-                ))
-            elif table_name == 'Contacts':
-                cursor.execute('''
-                    INSERT INTO Contacts (name, phone_number, email)
-                    VALUES (?, ?, ?)
-                ''', (
-                    row['name'],
-                    row['phone_number'],
-                    row['email']
-                ))
-            elif table_name == 'InstalledApps':
-                cursor.execute('''
-                    INSERT INTO InstalledApps (app_name, package_name, install_date)
-                    VALUES (?, ?, ?)
-                ''', (
-                    row['app_name'],
-                    row['package_name'],
-                    convert_time_to_string(row['install_date'])
-                ))
-            elif table_name == 'Keylogs':
-                cursor.execute('''
-                    INSERT INTO Keylogs (application, time, text)
-                    VALUES (?, ?, ?)
-                ''', (
-                    row['application'],
-                    convert_time_to_string(row['time']),
-                    row['text']
-                ))
-
-        conn.commit()
-        ui.notify(f'Data inserted into {table_name} table successfully!', type='positive')
-        display_table(table_name)
+async def spool_upload(file):
+    # Copy the upload in fixed-size blocks into a spooled file that stays in memory below
+    # ingest.SPOOL_THRESHOLD, hashing it on the way for the import ledger
+    digest = hashlib.sha256()
+    spooled = tempfile.SpooledTemporaryFile(max_size=ingest.SPOOL_THRESHOLD)
+    try:
+        async for block in file.iterate(chunk_size=1 << 20):
+            digest.update(block)
+            await run.io_bound(spooled.write, block)
+    except BaseException:
+        spooled.close()
+        raise
+    spooled.seek(0)
+    return spooled, digest.hexdigest()
+
+async def process_and_insert(event):
+    # NiceGUI has already received the whole upload; spool it, route it from its header row
+    # alone so unrecognized or malformed files are rejected before the body is parsed, and
+    # hand the import to the job queue
+    file = event.file
+    try:
+        with metrics.stage('spool'):
+            spooled, digest = await spool_upload(file)
     except Exception as e:
         ui.notify(f'Error processing file: {str(e)}', type='negative')
+        return
+    try:
+        with metrics.stage('read_header'):
+            header = await run.io_bound(ingest.read_header, spooled, file.name)
+    except Exception as e:
+        spooled.close()
+        ui.notify(f'Error processing file: {str(e)}', type='negative')
+        return
+    with metrics.stage('identify_table'):
+        table_name = identify_table(header)
+    if not table_name:
+        spooled.close()
+        ui.notify(f'Unable to identify the table for {file.name} (columns: {", ".join(header)}).', type='negative')
+        return
+
+    if await database.read(ingest.is_imported, digest):
+        spooled.close()
+        ui.notify(f'{file.name} was already imported; skipped.', type='info')
+        return
+    job = import_jobs.submit(file.name, lambda job: run_import(job, spooled, table_name, digest))
+    job.table_name = table_name
+    ui.notify(f'{file.name} queued as import #{job.id} into {table_name}', type='info')
+
+async def run_import(job, spooled, table_name, digest):
+    frames = ingest.iter_frames(spooled, job.file_name)
+    try:
+        job.check_cancelled()
+        # Insert data into the appropriate table, one committed batch at a time
+        # Converting, inserting and committing each batch are timed inside ingest
+        errors = ConversionErrors()
+        with metrics.stage('parse', table=table_name):
+            df = await run.io_bound(next, frames, None)
+        while df is not None:
+            job.check_cancelled()
+            job.rows_inserted += await database.write(ingest.insert_dataframe, df, table_name, errors)
+            change_feed.notify()
+            job.rows_parsed += len(df)
+            job.errors = errors.summary() if errors else None
+            job.error_count = errors.total
+            with metrics.stage('parse', table=table_name):
+                df = await run.io_bound(next, frames, None)
+        await database.write(ingest.record_import, digest, job.file_name, table_name, job.rows_parsed, job.rows_inserted)
+        job.message = f'Inserted {job.rows_inserted:,} new of {ingest.format_rate(job.rows_parsed, job.run_seconds)}'
     finally:
-        if os.path.exists(new_file_path):
-            os.unlink(new_file_path)
+        frames.close()
+        spooled.close()
 
-def identify_table(df):
-    df_columns = set(df.columns)
-    for table, columns in column_sets.items():
-        if columns.issubset(df_columns):
+def identify_table(columns):
+    columns = set(columns)
+    for table, required in column_sets.items():
+        if required.issubset(columns):
             return table
     return None
 
+def job_panel():
+    with ui.card().classes('w-full max-w-md'):
+        ui.label('Imports').classes('text-h6 q-mb-sm')
+        stats_label = ui.label().classes('text-caption')
+        table = ui.table(columns=[
+            {'name': 'id', 'label': '#', 'field': 'id'},
+            {'name': 'file_name', 'label': 'File', 'field': 'file_name', 'align': 'left'},
+            {'name': 'status', 'label': 'Status', 'field': 'status'},
+            {'name': 'rows_parsed', 'label': 'Parsed', 'field': 'rows_parsed'},
+            {'name': 'rows_inserted', 'label': 'New', 'field': 'rows_inserted'},
+            {'name': 'rows_per_sec', 'label': 'Rows/s', 'field': 'rows_per_sec'},
+            {'name': 'error_count', 'label': 'Invalid', 'field': 'error_count'},
+            {'name': 'message', 'label': '', 'field': 'message', 'align': 'left'},
+            {'name': 'cancel', 'label': '', 'field': 'id'},
+        ], rows=[], row_key='id').classes('w-full').props('flat dense')
+        table.add_slot('body-cell-cancel', '''
+            <q-td :props="props">
+                <q-btn v-if="props.row.status == 'queued' || props.row.status == 'running'"
+                       flat dense icon="cancel" @click="() => $parent.$emit('cancel', props.row.id)" />
+            </q-td>
+        ''')
+        # The invalid count links to the summary of which values were skipped, while running and after
+        table.add_slot('body-cell-error_count', '''
+            <q-td :props="props">
+                {{ props.value }}
+                <q-tooltip v-if="props.row.errors">{{ props.row.errors }}</q-tooltip>
+            </q-td>
+        ''')
+        table.on('cancel', lambda e: import_jobs.cancel(e.args))
+
+    def refresh():
+        table.rows = import_jobs.recent()
+        stats = import_jobs.stats()
+        stats_label.text = (f"{stats['queued']} queued, {stats['running']} running; "
+                            f"avg wait {stats['avg_wait_seconds']}s, avg run {stats['avg_run_seconds']}s")
+
+    refresh()
+    ui.timer(1.0, refresh)
+
 def bottom_navigation():
     with ui.footer().classes('bg-blue-600 text-white fixed-bottom'):
         with ui.row().classes('w-full justify-around items-center'):
@@ -221,6 +241,8 @@ def bottom_navigation():
 
 @ui.page('/')
 def main():
+    client_id = ui.context.client.id
+    ui.context.client.on_disconnect(lambda: close_view(client_id))
     ui.add_head_html('''
         <meta name="viewport" content="width=device-width, initial-scale=1, maximum-scale=1, user-scalable=no">
         <link href="https://fonts.googleapis.com/css2?family=Roboto:wght@300;400;500&display=swap" rel="stylesheet">
@@ -245,35 +267,140 @@ def main():
             ui.label('Upload Data').classes('text-h6 q-mb-sm')
             ui.upload(on_upload=process_and_insert).props('accept=.csv,.xlsx').classes('q-mb-md')
 
+        job_panel()
+
     bottom_navigation()
 
-def display_table(table_name, search_term=None):
-    with ui.column().classes('w-full content-area'):
+# The table view each client has open: client id -> function that closes it. Opening another
+# table replaces the view, so its search connection and feed subscription are released then
+open_views = {}
+
+def close_view(client_id):
+    close = open_views.pop(client_id, None)
+    if close:
+        close()
+
+async def display_table(table_name):
+    client = ui.context.client
+    close_view(client.id)
+    columns = await database.read(paging.table_columns, table_name)
+    # Text-heavy tables are searched through their FTS5 index, ranked, with highlighted snippets
+    indexed = await database.read(search.is_indexed, table_name)
+    # cursors[i] is the keyset cursor that starts page i; only the visible page is ever fetched
+    state = {'term': '', 'sort': 'rowid', 'descending': False, 'cursors': [None], 'next': None, 'pending': 0}
+    data_columns = [{'name': column, 'label': column, 'field': column, 'align': 'left'} for column in columns]
+    snippet_column = {'name': 'snippet', 'label': 'Match', 'field': 'snippet', 'align': 'left'}
+
+    def fetch(connection, term, cursor, rowids=None):
+        with metrics.query(connection, 'search' if term and indexed else 'display_table', table=table_name):
+            return views.table_page(connection, table_name, None if state['sort'] == 'rowid' else state['sort'],
+                                    state['descending'], cursor, term, indexed, rowids)
+
+    def show(rows):
+        with metrics.stage('render', name='display_table', table=table_name):
+            update_view(rows)
+
+    def update_view(rows):
+        searching = bool(state['term']) and indexed
+        table.columns = [snippet_column] + data_columns if searching else data_columns
+        table.rows = rows
+        sort_controls.set_visibility(not searching)
+        page_label.text = f"Page {len(state['cursors'])}"
+        previous_button.set_enabled(len(state['cursors']) > 1)
+        next_button.set_enabled(state['next'] is not None)
+        state['pending'] = 0
+        new_rows_button.set_visibility(False)
+
+    def rows_added(first, last, count, rows):
+        # The last page in upload order grows in place; any other view only counts what arrived
+        if not state['term'] and state['sort'] == 'rowid' and not state['descending'] and state['next'] is None:
+            shown = table.rows[-1]['_rowid'] if table.rows else 0
+            fresh = [row for row in rows if row['_rowid'] > shown]
+            room = paging.PAGE_SIZE - len(table.rows)
+            if fresh[:room]:
+                table.rows.extend(fresh[:room])
+                table.update()
+            if table.rows and (len(fresh) > room or count > len(rows)):
+                state['next'] = (None, table.rows[-1]['_rowid'])
+                next_button.set_enabled(True)
+            return
+        state['pending'] += count
+        new_rows_button.text = f"{state['pending']:,} new rows"
+        new_rows_button.set_visibility(True)
+
+    async def load_page():
+        rows, state['next'] = await database.read(fetch, state['term'], state['cursors'][-1])
+        show(rows)
+
+    async def change_search(term):
+        result = await pipeline.submit(term)
+        if result is None:
+            return
+        rows, state['next'] = result
+        state['term'] = term
+        state['cursors'] = [None]
+        show(rows)
+
+    async def change_sort(sort=None, descending=None):
+        if sort is not None:
+            state['sort'] = sort
+        if descending is not None:
+            state['descending'] = descending
+        state['cursors'] = [None]
+        await load_page()
+
+    async def next_page():
+        state['cursors'].append(state['next'])
+        await load_page()
+
+    async def previous_page():
+        state['cursors'].pop()
+        await load_page()
+
+    # Searches run on their own connection in a worker thread so they can be interrupted
+    pipeline = search.SearchPipeline(DATABASE_FILE, lambda connection, term, rowids: fetch(connection, term, None, rowids),
+                                     version=lambda: table_versions.get(table_name))
+
+    with ui.column().classes('w-full content-area') as view:
         ui.label(f'{table_name} Table').classes('text-h6 q-mb-md')
-        search_input = ui.input(placeholder='Search...', on_change=lambda e: display_table(table_name, e.value)).props('outlined dense')
-
-        query = f"SELECT * FROM {table_name}"
-        if search_term:
-            columns = [col[1] for col in cursor.execute(f"PRAGMA table_info({table_name})")]
-            search_conditions = " OR ".join([f"{col} LIKE ?" for col in columns])
-            query += f" WHERE {search_conditions}"
-            params = tuple(f"%{search_term}%" for _ in columns)
-        else:
-            params = ()
-
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
-        columns = [description[0] for description in cursor.description]
-
-        with ui.table().classes('w-full').props('flat bordered'):
-            with ui.thead():
-                for col in columns:
-                    ui.th().text(col)
-            with ui.tbody():
-                for row in rows:
-                    with ui.tr():
-                        for cell in row:
-                            ui.td().text(str(cell))
+        with ui.row().classes('items-center'):
+            search_input = ui.input(placeholder='Search...', on_change=lambda e: change_search(e.value or '')).props('outlined dense')
+            # Downloads whatever the search box currently matches, streamed straight from SQLite
+            with ui.button(icon='download').props('flat'):
+                with ui.menu():
+                    for export_format in export.FORMATS:
+                        ui.menu_item(export_format, on_click=lambda _, export_format=export_format: ui.download(
+                            f"/export/{table_name}?{urlencode({'format': export_format, 'q': state['term']})}"))
+
+        with ui.row().classes('items-center') as sort_controls:
+            ui.select({'rowid': 'Upload order', **{column: column for column in columns}}, value='rowid', label='Sort by',
+                      on_change=lambda e: change_sort(sort=e.value)).props('outlined dense')
+            ui.switch('Descending', on_change=lambda e: change_sort(descending=e.value))
+
+        table = ui.table(columns=data_columns, rows=[], row_key='_rowid').classes('w-full').props('flat bordered')
+        # Snippets are HTML-escaped in search.highlight before the <mark> tags are added
+        table.add_slot('body-cell-snippet', '<q-td :props="props"><span v-html="props.value"></span></q-td>')
+
+        with ui.row().classes('items-center'):
+            previous_button = ui.button(icon='chevron_left', on_click=previous_page).props('flat')
+            page_label = ui.label()
+            next_button = ui.button(icon='chevron_right', on_click=next_page).props('flat')
+            new_rows_button = ui.button(on_click=load_page).props('flat dense color=primary')
+            new_rows_button.set_visibility(False)
+
+    # Subscribed before the first load so nothing imported in between is missed;
+    # rows_added skips rows the page already shows
+    unsubscribe = await change_feed.subscribe(table_name, rows_added)
+
+    def close():
+        pipeline.close()
+        unsubscribe()
+        view.delete()
+
+    # Another display_table call may have finished while this one was loading
+    close_view(client.id)
+    open_views[client.id] = close
+    await load_page()
 
 if __name__ in {"__main__", "__mp_main__"}:
     create_tables()
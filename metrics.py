@@ -0,0 +1,122 @@
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# In-process stage timings and row counts, served in the Prometheus text format at /metrics.
+# Each server process keeps its own numbers; Prometheus sums them across scrape targets.
+# Query helpers run inside query(), which traces the statements they execute and logs them with
+# their plans when the helper takes longer than SLOW_QUERY_MS.
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 250))
+# Statements kept per traced block; executemany fires the trace once per row
+TRACE_LIMIT = 20
+
+log = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+
+
+def _key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def observe(stage, seconds, **labels):
+    key = _key({'stage': stage, **labels})
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {'buckets': [0] * len(BUCKETS), 'sum': 0.0, 'count': 0}
+        for index, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram['buckets'][index] += 1
+        histogram['sum'] += seconds
+        histogram['count'] += 1
+
+
+def count(metric, value=1, **labels):
+    key = (metric, _key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+@contextmanager
+def stage(name, **labels):
+    # Times the block into the stage histogram, whether it succeeds or raises
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def explain(conn, sql):
+    if not re.match(r'\s*(SELECT|WITH)\b', sql, re.IGNORECASE):
+        return None
+    try:
+        return '; '.join(row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}"))
+    except Exception as e:
+        return f"(no plan: {e})"
+
+
+@contextmanager
+def query(conn, name, threshold_ms=None, **labels):
+    # A query helper's work on conn: timed as stage 'query', and logged statement by statement with
+    # plans when slow. The trace callback receives each statement with its values bound in, so
+    # plans can be explained after the fact. Statements run by triggers ('-- TRIGGER ...') are skipped.
+    statements = []
+
+    def trace(sql):
+        if len(statements) < TRACE_LIMIT and not sql.startswith('--'):
+            statements.append(sql)
+
+    threshold_ms = SLOW_QUERY_MS if threshold_ms is None else threshold_ms
+    conn.set_trace_callback(trace)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        conn.set_trace_callback(None)
+        observe('query', elapsed, name=name, **labels)
+        if elapsed * 1000 >= threshold_ms:
+            count('slow_queries', name=name, **labels)
+            lines = [' '.join(['slow query', name] + [f"{key}={value}" for key, value in labels.items()]) + f": {elapsed * 1000:.0f} ms"]
+            for sql in statements:
+                lines.append(f"  {' '.join(sql.split())}")
+                plan = explain(conn, sql)
+                if plan:
+                    lines.append(f"    plan: {plan}")
+            log.warning('\n'.join(lines))
+
+
+def _labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def render(prefix='nicesql'):
+    with _lock:
+        histograms = {key: {**value, 'buckets': list(value['buckets'])} for key, value in _histograms.items()}
+        counters = dict(_counters)
+    lines = [f"# HELP {prefix}_stage_seconds Time spent per stage.", f"# TYPE {prefix}_stage_seconds histogram"]
+    for key, histogram in sorted(histograms.items()):
+        for bound, value in zip(BUCKETS, histogram['buckets']):
+            lines.append(f"{prefix}_stage_seconds_bucket{_labels(key, [('le', repr(bound))])} {value}")
+        lines.append(f"{prefix}_stage_seconds_bucket{_labels(key, [('le', '+Inf')])} {histogram['count']}")
+        lines.append(f"{prefix}_stage_seconds_sum{_labels(key)} {histogram['sum']:.6f}")
+        lines.append(f"{prefix}_stage_seconds_count{_labels(key)} {histogram['count']}")
+    for name in sorted({name for name, _ in counters}):
+        lines.append(f"# TYPE {prefix}_{name}_total counter")
+        for (counter, key), value in sorted(counters.items()):
+            if counter == name:
+                lines.append(f"{prefix}_{name}_total{_labels(key)} {value}")
+    return '\n'.join(lines) + '\n'
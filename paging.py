@@ -0,0 +1,89 @@
+PAGE_SIZE = 50
+
+
+def table_columns(conn, table_name):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table_name})")]
+
+
+def keyset_branches(sort_column, descending, cursor):
+    # Rows strictly after (value, rowid) in ORDER BY sort_column, rowid, as (condition, params) branches
+    # in output order. SQLite sorts NULLs first, so ascending pages run through the NULLs and then the
+    # values, descending ones the other way round; a cursor whose value is None is in the NULL part.
+    # Each branch is a plain range that seeks the sort column's index, where one condition with an OR
+    # across the NULL boundary would scan it.
+    value, rowid = cursor
+    op = '<' if descending else '>'
+    if sort_column is None:
+        return [(f"rowid {op} ?", [rowid])]
+    nulls = (f"{sort_column} IS NULL", [])
+    values = (f"{sort_column} IS NOT NULL", [])
+    if value is None:
+        nulls = (f"{sort_column} IS NULL AND rowid {op} ?", [rowid])
+        if descending:
+            values = None
+    else:
+        values = (f"({sort_column}, rowid) {op} (?, ?)", [value, rowid])
+        if not descending:
+            nulls = None
+    return [branch for branch in ([values, nulls] if descending else [nulls, values]) if branch]
+
+
+def fetch_page(conn, table_name, sort_column=None, descending=False, cursor=None, search_term=None, rowids=None, filters=None, ranges=None, extra_columns=None, limit=PAGE_SIZE):
+    columns = table_columns(conn, table_name)
+    if sort_column is not None and sort_column not in columns:
+        raise ValueError(f"Unknown column for {table_name}: {sort_column}")
+
+    conditions, params = [], []
+    for column, value in (filters or {}).items():
+        if column not in columns:
+            raise ValueError(f"Unknown column for {table_name}: {column}")
+        # IS matches NULL as well as equal values and can still use an index
+        conditions.append(f"{column} IS ?")
+        params.append(value)
+    # ranges maps a column to inclusive (low, high) bounds, either of which may be None
+    for column, bounds in (ranges or {}).items():
+        if column not in columns:
+            raise ValueError(f"Unknown column for {table_name}: {column}")
+        for op, bound in zip(('>=', '<='), bounds):
+            if bound is not None:
+                conditions.append(f"{column} {op} ?")
+                params.append(bound)
+    if search_term:
+        conditions.append('(' + ' OR '.join(f"{column} LIKE ?" for column in columns) + ')')
+        params.extend(f"%{search_term}%" for _ in columns)
+    if rowids is not None:
+        conditions.append(f"rowid IN ({', '.join('?' for _ in rowids)})")
+        params.extend(rowids)
+
+    direction = 'DESC' if descending else 'ASC'
+    order = f"{sort_column} {direction}, rowid {direction}" if sort_column else f"rowid {direction}"
+    # extra_columns are SQL expressions selected alongside each row, e.g. a correlated lookup
+    select = f"SELECT {', '.join([f'{table_name}.rowid AS _rowid', f'{table_name}.*'] + (extra_columns or []))} FROM {table_name}"
+
+    def branch_query(branch_conditions):
+        query = select
+        if branch_conditions:
+            query += ' WHERE ' + ' AND '.join(branch_conditions)
+        return query + f" ORDER BY {order} LIMIT ?"
+
+    # One extra row tells us whether there is a next page without a COUNT(*)
+    branches = keyset_branches(sort_column, descending, cursor) if cursor is not None else [(None, [])]
+    if len(branches) == 1:
+        condition, cursor_params = branches[0]
+        query = branch_query(conditions + ([condition] if condition else []))
+        query_params = params + cursor_params + [limit + 1]
+    else:
+        # A page that crosses the NULL boundary: each side is read by its own index range and the
+        # two short results are merged, which sorts at most twice the page size
+        query = ' UNION ALL '.join(f"SELECT * FROM ({branch_query(conditions + [condition])})" for condition, _ in branches)
+        query += f" ORDER BY {sort_column} {direction}, _rowid {direction} LIMIT ?"
+        query_params = [value for _, cursor_params in branches for value in params + cursor_params + [limit + 1]] + [limit + 1]
+    result = conn.execute(query, query_params)
+    names = [description[0] for description in result.description]
+    rows = [dict(zip(names, row)) for row in result.fetchall()]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = (last[sort_column] if sort_column else None, last['_rowid'])
+    return rows, next_cursor
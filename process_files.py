@@ -1,23 +1,152 @@
-import pandas as pd
-from main import process_and_insert, conn, cursor
+import argparse
+import glob
+import multiprocessing
 import os
+import queue
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 
-files = [
-    'attachments/calls.xlsx',
-    'attachments/contacts.xlsx',
-    'attachments/installed+apps.xlsx',  # Changed 'installed apps.xlsx' to 'installed+apps.xlsx'
-    'attachments/keylogs.xlsx',
-    'attachments/messanger.xlsx',
-    'attachments/sms.xlsx'
-]
-
-for file in files:
-    print(f'Processing {file}...')
-    if os.path.exists(file):
-        df = pd.read_excel(file)
-        process_and_insert({'name': file, 'content': df})
-    else:
-        print(f"File not found: {file}")
-
-print('All files processed.')
-conn.close()
+import db
+import ingest
+import schema
+from converters import ConversionErrors
+
+# Headless bulk loader: parses exports in parallel worker processes and funnels the
+# converted batches to this process, the only one that writes to the database.
+# Nothing here imports NiceGUI.
+
+EXTENSIONS = ('.csv', '.xlsx')
+# How long the writer waits for a message before checking whether a worker died
+POLL_SECONDS = 1.0
+
+
+def find_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            matches = glob.glob(os.path.join(path, '**', '*'), recursive=True)
+        else:
+            matches = glob.glob(path, recursive=True) or [path]
+        files.extend(match for match in sorted(matches) if match.lower().endswith(EXTENSIONS))
+    return list(dict.fromkeys(files))
+
+
+# Set once per worker process by init_worker rather than pickled with every file
+imported = set()
+batches = None
+
+
+def init_worker(imported_hashes, batch_queue):
+    global imported, batches
+    imported = imported_hashes
+    batches = batch_queue
+
+
+def parse_file(path, batch_size):
+    # Runs in a worker process; every file ends with exactly one 'done', 'skipped' or 'error' message
+    start = time.perf_counter()
+    try:
+        with open(path, 'rb') as f:
+            digest = ingest.file_digest(f)
+        if digest in imported:
+            batches.put(('skipped', path, 'already imported'))
+            return
+        errors = ConversionErrors()
+        table_name = None
+        parsed = 0
+        for frame in ingest.iter_frames(path, path, batch_size):
+            if table_name is None:
+                table_name = ingest.identify_table(frame.columns)
+                if table_name is None:
+                    batches.put(('skipped', path, 'unrecognized columns'))
+                    return
+            batches.put(('batch', path, table_name, ingest.build_rows(frame, table_name, errors)))
+            parsed += len(frame)
+        batches.put(('done', path, table_name, digest, parsed, errors.summary() if errors else None, time.perf_counter() - start))
+    except Exception as e:
+        batches.put(('error', path, str(e)))
+
+
+def write_batches(conn, batch_queue, futures, totals):
+    # The single writer: inserts batches as they arrive and records each finished file.
+    # futures maps each parse_file future to its path. A worker that dies (BrokenProcessPool) never
+    # sends its file's final message, so a file whose future raised is counted as failed instead.
+    inserted = {}
+    pending = set(futures.values())
+    while pending:
+        try:
+            message = batch_queue.get(timeout=POLL_SECONDS)
+        except queue.Empty:
+            for future, path in futures.items():
+                if path in pending and future.done() and (future.cancelled() or future.exception() is not None):
+                    pending.discard(path)
+                    inserted.pop(path, None)
+                    totals['failed'] += 1
+                    error = 'cancelled' if future.cancelled() else f'worker died: {future.exception()}'
+                    print(f'{path}: failed ({error})', file=sys.stderr)
+            continue
+        kind, path = message[0], message[1]
+        if path not in pending:
+            continue
+        if kind == 'batch':
+            _, _, table_name, rows = message
+            inserted[path] = inserted.get(path, 0) + ingest.bulk_insert(conn, table_name, rows)
+            continue
+
+        pending.discard(path)
+        if kind == 'done':
+            _, _, table_name, digest, parsed, errors, elapsed = message
+            new_rows = inserted.pop(path, 0)
+            ingest.record_import(conn, digest, os.path.basename(path), table_name, parsed, new_rows)
+            totals['imported'] += 1
+            totals['parsed'] += parsed
+            totals['inserted'] += new_rows
+            print(f'{path}: {table_name} {ingest.format_rate(parsed, elapsed)}, {new_rows:,} new')
+            if errors:
+                print(f'  {errors}')
+        elif kind == 'skipped':
+            totals['skipped'] += 1
+            print(f'{path}: skipped ({message[2]})')
+        else:
+            totals['failed'] += 1
+            inserted.pop(path, None)
+            print(f'{path}: failed ({message[2]})', file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk-import CSV/XLSX exports into the database.')
+    parser.add_argument('paths', nargs='*', default=['attachments'], help='files, directories or glob patterns')
+    parser.add_argument('--database', default='data.db')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--batch-size', type=int, default=ingest.BATCH_SIZE)
+    args = parser.parse_args()
+
+    files = find_files(args.paths)
+    if not files:
+        print('No CSV or XLSX files found.')
+        return 1
+
+    conn = db.connect(args.database)
+    schema.migrate(conn)
+    imported_hashes = {row[0] for row in conn.execute('SELECT content_hash FROM ImportLedger')}
+
+    start = time.perf_counter()
+    totals = {'imported': 0, 'skipped': 0, 'failed': 0, 'parsed': 0, 'inserted': 0}
+    with multiprocessing.Manager() as manager:
+        # Bounded so fast parsers cannot run far ahead of the writer
+        batch_queue = manager.Queue(maxsize=args.workers * 2)
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                                 initargs=(imported_hashes, batch_queue)) as pool:
+            futures = {pool.submit(parse_file, path, args.batch_size): path for path in files}
+            write_batches(conn, batch_queue, futures, totals)
+
+    conn.close()
+    elapsed = time.perf_counter() - start
+    print(f"\n{totals['imported']} imported, {totals['skipped']} skipped, {totals['failed']} failed; "
+          f"{ingest.format_rate(totals['parsed'], elapsed)}, {totals['inserted']:,} new")
+    return 1 if totals['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,10 +2,19 @@ from nicegui import ui
 import pandas as pd
 import sqlite3
 from datetime import datetime
-import re
 import os
+import sys
 from werkzeug.utils import secure_filename
 import tempfile
+
+# Shared ingestion modules live in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ingest
+import rollups
+import schema
+import versions
+from converters import ConversionErrors, normalize_phone
 # Configuration for Replit will be added at the end of the file
 
 # Define column_sets before the process_and_insert function
@@ -27,27 +36,6 @@ conn = sqlite3.connect(DATABASE_FILE)
 cursor = conn.cursor()
 
 # Utility Functions
-def convert_time_to_string(time_str):
-    try:
-        year_match = re.search(r"(\d{4})", time_str)
-        year = year_match.group(1) if year_match else datetime.now().year
-        return datetime.strptime(f"{year} {time_str}", '%Y %b %d, %I:%M %p').strftime('%Y-%m-%d %H:%M:%S')
-    except (ValueError, TypeError):
-        ui.notify(f"Invalid time format: {time_str}", type='error')
-        return None
-
-def convert_duration_to_seconds(duration_str):
-    if pd.isnull(duration_str):
-        return None
-    match = re.match(r"(?:(\d+)\s*Min)?(?:\s*&\s*)?(?:(\d+)\s*Sec)?", duration_str)
-    if match:
-        minutes = int(match.group(1)) if match.group(1) else 0
-        seconds = int(match.group(2)) if match.group(2) else 0
-        return minutes * 60 + seconds
-    else:
-        ui.notify(f"Invalid duration format: {duration_str}", type='error')
-        return None
-
 def validate_required_columns(df, required_columns):
     if not set(required_columns).issubset(df.columns):
         missing_columns = set(required_columns) - set(df.columns)
@@ -57,65 +45,44 @@ def validate_required_columns(df, required_columns):
 
 # Table Creation
 def create_tables():
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS Calls (
-            call_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            call_type TEXT,
-            time DATETIME,
-            from_to TEXT,
-            duration_sec INTEGER,
-            location TEXT
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS Messenger (
-            message_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            contact_name TEXT,
-            message_time DATETIME,
-            message_text TEXT
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS SMS (
-            sms_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            phone_number TEXT,
-            message_time DATETIME,
-            message_text TEXT,
-            location TEXT
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS Contacts (
-            contact_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT,
-            phone_number TEXT,
-            email TEXT
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS InstalledApps (
-            app_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            app_name TEXT,
-            package_name TEXT,
-            install_date DATETIME
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS Keylogs (
-            keylog_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            application TEXT,
-            time DATETIME,
-            text TEXT
-        )
-    ''')
-    conn.commit()
+    schema.migrate(conn)
     ui.notify('Tables created successfully!', type='positive')
 
 def process_and_insert(file):
-    # [Existing implementation]
+    temp_file_path = None
+    try:
+        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(secure_filename(file.name))[1], dir=PROJECT_DIR) as temp_file:
+            temp_file.write(file.content.read())
+            temp_file_path = temp_file.name
+
+        df = pd.read_csv(temp_file_path) if temp_file_path.endswith('.csv') else pd.read_excel(temp_file_path)
+
+        table_name = identify_table(df)
+        if not table_name:
+            ui.notify('Unable to identify the table for this data.', type='negative')
+            return
+
+        if not validate_required_columns(df, column_sets[table_name]):
+            return
+
+        errors = ConversionErrors()
+        ingest.insert_dataframe(conn, df, table_name, errors)
+        if errors:
+            ui.notify(errors.summary(), type='warning', multi_line=True)
+
+        ui.notify(f'Data inserted into {table_name} table successfully!', type='positive')
+    except Exception as e:
+        ui.notify(f'Error processing file: {str(e)}', type='negative')
+    finally:
+        if temp_file_path and os.path.exists(temp_file_path):
+            os.unlink(temp_file_path)
 
 def identify_table(df):
-    # [Existing implementation]
+    df_columns = set(df.columns)
+    for table, columns in column_sets.items():
+        if columns.issubset(df_columns):
+            return table
+    return None
 
 @ui.page('/')
 def main():
@@ -254,8 +221,15 @@ def main():
                 if msg.strip():
                     table = 'Messenger' if current_section.value == 'individual_chats' else 'SMS'
                     id_column = 'contact_name' if table == 'Messenger' else 'phone_number'
-                    cursor.execute(f'INSERT INTO {table} ({id_column}, message_time, message_text) VALUES (?, ?, ?)',
-                                   (current_chat.value, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), msg))
+                    values = {id_column: current_chat.value, 'message_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'message_text': msg}
+                    if table == 'SMS':
+                        # Derived from phone_number as ingest.build_rows does; Messenger has no phone_norm
+                        values['phone_norm'] = normalize_phone(current_chat.value)
+                    cursor.execute(f"INSERT INTO {table} ({', '.join(values)}) VALUES ({', '.join('?' for _ in values)})",
+                                   tuple(values.values()))
+                    # Inserts outside ingest.bulk_insert add their rows to the rollups and bump the table version themselves
+                    rollups.add_rows(conn, table, 'rowid = ?', (cursor.lastrowid,))
+                    versions.bump(conn, table)
                     conn.commit()
                     display_messages.refresh()
                     new_message.set_value('')
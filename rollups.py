@@ -0,0 +1,221 @@
+import db
+
+# Aggregates of the raw tables, so reads never scan them. New rows are added a batch at a time by
+# add_rows (from ingest.bulk_insert) in the same transaction as the insert: one GROUP BY upsert per
+# rollup and period costs far less than a trigger upsert per row. Deletes (archiving) are still
+# subtracted by per-row triggers. Each rollup row is keyed by
+# period ('day' or 'week', weeks starting on Monday), the period's first day and the rollup's keys;
+# rows whose time failed to convert are counted under period_start ''.
+PERIODS = {
+    'day': "date({time})",
+    'week': "date({time}, 'weekday 0', '-6 days')",
+}
+
+# Upper bounds (seconds) of the call-duration histogram buckets percentiles are read from;
+# the last bucket is open-ended
+DURATION_BUCKETS = [0, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200]
+
+DURATION_BUCKET = 'CASE ' + ' '.join(
+    f"WHEN IFNULL({{row}}.duration_sec, 0) <= {bound} THEN {index}" for index, bound in enumerate(DURATION_BUCKETS)
+) + f" ELSE {len(DURATION_BUCKETS)} END"
+
+# source: raw table; time: its time column, or None for rollups without periods;
+# keys/measures: SQL expressions over the raw row ({row}); measures are summed, and the first
+# one counts rows, so a rollup row is dropped once everything it counted is deleted
+ROLLUPS = [
+    {
+        'table': 'CallRollup', 'source': 'Calls', 'time': 'time',
+        'keys': {'contact': "COALESCE({row}.phone_norm, {row}.from_to, '')", 'call_type': "IFNULL({row}.call_type, '')"},
+        'measures': {'calls': '1', 'duration_sec': 'IFNULL({row}.duration_sec, 0)'},
+    },
+    {
+        'table': 'CallDurationHistogram', 'source': 'Calls', 'time': None,
+        'keys': {'call_type': "IFNULL({row}.call_type, '')", 'bucket': DURATION_BUCKET},
+        'measures': {'calls': '1'},
+    },
+    {
+        'table': 'MessageRollup', 'source': 'Messages', 'time': 'time',
+        'keys': {'source': "'Messages'", 'contact': "COALESCE({row}.phone_norm, {row}.from_to, '')"},
+        'measures': {'messages': '1', 'characters': "LENGTH(IFNULL({row}.message, ''))"},
+    },
+    {
+        'table': 'MessageRollup', 'source': 'SMS', 'time': 'message_time',
+        'keys': {'source': "'SMS'", 'contact': "COALESCE({row}.phone_norm, {row}.phone_number, '')"},
+        'measures': {'messages': '1', 'characters': "LENGTH(IFNULL({row}.message_text, ''))"},
+    },
+    {
+        'table': 'MessageRollup', 'source': 'Messenger', 'time': 'message_time',
+        'keys': {'source': "'Messenger'", 'contact': "IFNULL({row}.contact_name, '')"},
+        'measures': {'messages': '1', 'characters': "LENGTH(IFNULL({row}.message_text, ''))"},
+    },
+    {
+        'table': 'KeylogRollup', 'source': 'Keylogs', 'time': 'time',
+        'keys': {'application': "IFNULL({row}.application, '')"},
+        'measures': {'entries': '1', 'characters': "LENGTH(IFNULL({row}.text, ''))"},
+    },
+    {
+        'table': 'InstallRollup', 'source': 'InstalledApps', 'time': 'install_date',
+        'keys': {},
+        'measures': {'installs': '1'},
+    },
+]
+
+ROLLUP_TABLES = {}
+for _spec in ROLLUPS:
+    ROLLUP_TABLES.setdefault(_spec['table'], _spec)
+
+
+def key_columns(spec):
+    return (['period', 'period_start'] if spec['time'] else []) + list(spec['keys'])
+
+
+def key_values(spec, row, period=None):
+    values = [f"'{period}'", f"IFNULL({PERIODS[period].format(time=f'{row}.' + spec['time'])}, '')"] if period else []
+    return values + [expression.format(row=row) for expression in spec['keys'].values()]
+
+
+def create_table_sql(spec):
+    keys = key_columns(spec)
+    columns = [f"{column} NOT NULL" for column in keys]
+    columns += [f"{measure} INTEGER NOT NULL DEFAULT 0" for measure in spec['measures']]
+    return f"CREATE TABLE IF NOT EXISTS {spec['table']} ({', '.join(columns)}, PRIMARY KEY ({', '.join(keys)}));"
+
+
+def trigger_name(spec):
+    return f"rollup_{spec['table'].lower()}_{spec['source'].lower()}"
+
+
+def trigger_sql(spec):
+    table, source = spec['table'], spec['source']
+    keys, measures = key_columns(spec), list(spec['measures'])
+    periods = list(PERIODS) if spec['time'] else [None]
+    name = trigger_name(spec)
+
+    upserts, updates = [], []
+    for period in periods:
+        new_values = key_values(spec, 'new', period) + [spec['measures'][measure].format(row='new') for measure in measures]
+        upserts.append(f'''
+            INSERT INTO {table} ({', '.join(keys + measures)}) VALUES ({', '.join(new_values)})
+            ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {', '.join(f"{measure} = {measure} + excluded.{measure}" for measure in measures)};''')
+        where = ' AND '.join(f"{column} = {value}" for column, value in zip(keys, key_values(spec, 'old', period)))
+        updates.append(f'''
+            UPDATE {table} SET {', '.join(f"{measure} = {measure} - ({spec['measures'][measure].format(row='old')})" for measure in measures)}
+            WHERE {where};
+            DELETE FROM {table} WHERE {where} AND {measures[0]} <= 0;''')
+    return f'''
+        CREATE TRIGGER IF NOT EXISTS {name}_insert AFTER INSERT ON {source} BEGIN{''.join(upserts)}
+        END;
+        CREATE TRIGGER IF NOT EXISTS {name}_delete AFTER DELETE ON {source} BEGIN{''.join(updates)}
+        END;
+    '''
+
+
+def backfill_statements(spec, where=None):
+    # One statement per period adding the source rows (optionally only those matching where) to the rollup
+    source, keys, measures = spec['source'], key_columns(spec), list(spec['measures'])
+    condition = f" WHERE {where}" if where else ''
+    statements = []
+    for period in (list(PERIODS) if spec['time'] else [None]):
+        values = key_values(spec, source, period)
+        statements.append(f'''
+            INSERT INTO {spec['table']} ({', '.join(keys + measures)})
+            SELECT {', '.join(values + [f"SUM({spec['measures'][measure].format(row=source)})" for measure in measures])}
+            FROM {source}{condition} GROUP BY {', '.join(values)}
+            ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {', '.join(f"{measure} = {measure} + excluded.{measure}" for measure in measures)};''')
+    return statements
+
+
+def backfill_sql(spec):
+    return ''.join(backfill_statements(spec))
+
+
+def add_rows(conn, source, where, params=()):
+    # Adds the source rows matching where to every rollup of that table; runs inside the caller's
+    # transaction. Callers pass the rows they just inserted (e.g. 'rowid > ?'), or rows about to be
+    # deleted, so the delete triggers' subtraction leaves the rollups unchanged.
+    for spec in ROLLUPS:
+        if spec['source'] == source:
+            for statement in backfill_statements(spec, where):
+                conn.execute(statement, params)
+
+
+def create_rollups(conn):
+    statements = [create_table_sql(spec) for spec in ROLLUP_TABLES.values()]
+    for spec in ROLLUPS:
+        statements.append(trigger_sql(spec))
+        statements.append(backfill_sql(spec))
+    db.execute_script(conn, '\n'.join(statements))
+
+
+def drop_insert_triggers(conn):
+    # Replaced by add_rows in ingest.bulk_insert; the delete triggers stay
+    statements = [f"DROP TRIGGER IF EXISTS {trigger_name(spec)}_insert;" for spec in ROLLUPS]
+    db.execute_script(conn, '\n'.join(statements))
+
+
+def summary(conn, table_name, period=None, group_by=(), since=None, until=None, filters=None, order_by=None, limit=100):
+    # Sums a rollup's measures per period_start (when period is given) and the group_by keys,
+    # largest order_by first (default: latest period first).
+    # Reads only rollup rows, via the (period, period_start, ...) primary key.
+    spec = ROLLUP_TABLES.get(table_name)
+    if spec is None:
+        raise ValueError(f"Unknown rollup: {table_name}")
+    group_by = list(group_by)
+    unknown = [column for column in group_by + list(filters or {}) if column not in spec['keys']]
+    if unknown:
+        raise ValueError(f"Unknown key for {table_name}: {', '.join(unknown)}")
+    if spec['time'] and period is not None and period not in PERIODS:
+        raise ValueError(f"period must be one of {', '.join(PERIODS)}")
+
+    conditions, params = [], []
+    if spec['time']:
+        # Without a period the weekly rows are summed into totals for the whole range
+        conditions.append('period = ?')
+        params.append(period or 'week')
+        if since:
+            conditions.append('period_start >= ?')
+            params.append(since)
+        if until:
+            conditions.append('period_start <= ?')
+            params.append(until)
+        if period:
+            group_by = ['period_start'] + group_by
+    for column, value in (filters or {}).items():
+        conditions.append(f"{column} = ?")
+        params.append(value)
+
+    measures = list(spec['measures'])
+    select = group_by + [f"SUM({measure}) AS {measure}" for measure in measures]
+    query = f"SELECT {', '.join(select)} FROM {table_name}"
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    if group_by:
+        query += f" GROUP BY {', '.join(group_by)}"
+    if order_by:
+        if order_by not in group_by + measures:
+            raise ValueError(f"Unknown column for {table_name}: {order_by}")
+        query += f" ORDER BY {order_by} DESC"
+    elif group_by:
+        query += f" ORDER BY {group_by[0]} DESC"
+    query += ' LIMIT ?'
+    result = conn.execute(query, params + [limit])
+    names = [description[0] for description in result.description]
+    return [dict(zip(names, row)) for row in result.fetchall()]
+
+
+def duration_percentiles(conn, call_type=None, percentiles=(50, 90, 99)):
+    # Upper bound of the histogram bucket holding each percentile; None for the open-ended bucket
+    condition, params = ('WHERE call_type = ?', [call_type]) if call_type is not None else ('', [])
+    counts = conn.execute(f"SELECT bucket, SUM(calls) FROM CallDurationHistogram {condition} GROUP BY bucket ORDER BY bucket", params).fetchall()
+    total = sum(count for _, count in counts)
+    result = {}
+    for percentile in percentiles:
+        target, seen = total * percentile / 100, 0
+        for bucket, count in counts:
+            seen += count
+            if count and seen >= target:
+                result[f"p{percentile}"] = DURATION_BUCKETS[bucket] if bucket < len(DURATION_BUCKETS) else None
+                break
+        else:
+            result[f"p{percentile}"] = None
+    return {'calls': total, **result}
@@ -0,0 +1,201 @@
+import conversations
+import db
+import rollups
+import search
+import versions
+from converters import normalize_phone
+
+# Columns that identify the same record across exports; re-imported rows are ignored on these
+NATURAL_KEYS = {
+    'Calls': ('call_type', 'time', 'from_to'),
+    'Messenger': ('contact_name', 'message_time', 'message_text'),
+    'SMS': ('phone_number', 'message_time', 'message_text'),
+    'Messages': ('message_type', 'time', 'from_to', 'message'),
+    'Contacts': ('name', 'phone_number', 'email'),
+    'InstalledApps': ('app_name', 'package_name', 'install_date'),
+    'Keylogs': ('application', 'time', 'text'),
+}
+
+
+def add_natural_keys(conn):
+    # Drop the duplicates earlier re-imports left behind, keeping the first copy of each row,
+    # then enforce the key. Deletes go through the FTS triggers, so the indexes stay in sync.
+    # IFNULL makes rows whose time failed to convert (NULL) still count as duplicates.
+    statements = ['''
+        CREATE TABLE IF NOT EXISTS ImportLedger (
+            content_hash TEXT PRIMARY KEY,
+            file_name TEXT,
+            table_name TEXT,
+            rows_parsed INTEGER,
+            rows_inserted INTEGER,
+            imported_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+    ''']
+    for table_name, columns in NATURAL_KEYS.items():
+        key = ', '.join(f"IFNULL({column}, '')" for column in columns)
+        statements.append(f"DELETE FROM {table_name} WHERE rowid NOT IN (SELECT MIN(rowid) FROM {table_name} GROUP BY {key});")
+        statements.append(f"CREATE UNIQUE INDEX IF NOT EXISTS uq_{table_name.lower()}_natural_key ON {table_name} ({key});")
+    db.execute_script(conn, '\n'.join(statements))
+
+
+# Phone column of each table that gets a normalized copy in phone_norm
+PHONE_COLUMNS = {
+    'Calls': 'from_to',
+    'SMS': 'phone_number',
+    'Messages': 'from_to',
+    'Contacts': 'phone_number',
+}
+
+
+def add_phone_numbers(conn):
+    # New rows get phone_norm from ingest (converters.convert_phones); existing rows are
+    # backfilled here with the same function so both agree. Columns already added by a run that
+    # failed part way are kept, so the migration can simply be run again.
+    conn.create_function('normalize_phone', 1, normalize_phone, deterministic=True)
+    statements = []
+    for table_name, column in PHONE_COLUMNS.items():
+        if 'phone_norm' not in (row[1] for row in conn.execute(f"PRAGMA table_info({table_name})")):
+            statements.append(f"ALTER TABLE {table_name} ADD COLUMN phone_norm TEXT;")
+        statements.append(f"UPDATE {table_name} SET phone_norm = normalize_phone({column}) WHERE {column} IS NOT NULL;")
+    db.execute_script(conn, '\n'.join(statements) + '''
+        CREATE INDEX IF NOT EXISTS idx_contacts_phone_norm_name ON Contacts (phone_norm, name);
+        CREATE INDEX IF NOT EXISTS idx_calls_phone_norm_time ON Calls (phone_norm, time);
+        CREATE INDEX IF NOT EXISTS idx_sms_phone_norm_time ON SMS (phone_norm, message_time);
+        CREATE INDEX IF NOT EXISTS idx_messages_phone_norm_time ON Messages (phone_norm, time);
+    ''')
+    conversations.rekey_by_phone(conn)
+
+
+# Every table used by the main app (Messenger/SMS) and the data-management-system app (Messages).
+# The version number of each migration is its position in the list; PRAGMA user_version records
+# the last one applied, so existing databases are upgraded in place. Append, never edit.
+MIGRATIONS = [
+    # 1: the tables previously created by create_tables.py and both create_tables() functions
+    '''
+    CREATE TABLE IF NOT EXISTS Calls (
+        call_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        call_type TEXT,
+        time DATETIME,
+        from_to TEXT,
+        duration_sec INTEGER,
+        location TEXT
+    );
+    CREATE TABLE IF NOT EXISTS Messenger (
+        message_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        contact_name TEXT,
+        message_time DATETIME,
+        message_text TEXT
+    );
+    CREATE TABLE IF NOT EXISTS SMS (
+        sms_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        phone_number TEXT,
+        message_time DATETIME,
+        message_text TEXT,
+        location TEXT
+    );
+    CREATE TABLE IF NOT EXISTS Messages (
+        message_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        message_type TEXT,
+        time DATETIME,
+        from_to TEXT,
+        message TEXT
+    );
+    CREATE TABLE IF NOT EXISTS Contacts (
+        contact_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT,
+        phone_number TEXT,
+        email TEXT
+    );
+    CREATE TABLE IF NOT EXISTS InstalledApps (
+        app_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        app_name TEXT,
+        package_name TEXT,
+        install_date DATETIME
+    );
+    CREATE TABLE IF NOT EXISTS Keylogs (
+        keylog_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        application TEXT,
+        time DATETIME,
+        text TEXT
+    );
+    ''',
+    # 2: full-text indexes for the text-heavy tables
+    search.create_fts_indexes,
+    # 3: newest-first listings and per-contact lookups
+    '''
+    CREATE INDEX IF NOT EXISTS idx_calls_time ON Calls (time);
+    CREATE INDEX IF NOT EXISTS idx_calls_from_to_time ON Calls (from_to, time);
+    CREATE INDEX IF NOT EXISTS idx_messenger_time ON Messenger (message_time);
+    CREATE INDEX IF NOT EXISTS idx_messenger_contact_time ON Messenger (contact_name, message_time);
+    CREATE INDEX IF NOT EXISTS idx_sms_time ON SMS (message_time);
+    CREATE INDEX IF NOT EXISTS idx_sms_phone_time ON SMS (phone_number, message_time);
+    CREATE INDEX IF NOT EXISTS idx_messages_time ON Messages (time);
+    CREATE INDEX IF NOT EXISTS idx_messages_from_to_time ON Messages (from_to, time);
+    CREATE INDEX IF NOT EXISTS idx_contacts_phone_name ON Contacts (phone_number, name);
+    CREATE INDEX IF NOT EXISTS idx_installed_apps_install_date ON InstalledApps (install_date);
+    CREATE INDEX IF NOT EXISTS idx_keylogs_time ON Keylogs (time);
+    CREATE INDEX IF NOT EXISTS idx_keylogs_application_time ON Keylogs (application, time);
+    ''',
+    # 4: import ledger and natural-key unique indexes for idempotent re-imports
+    add_natural_keys,
+    # 5: per-counterpart conversation summary for the Messages view
+    conversations.create_conversation_summary,
+    # 6: normalized phone numbers for matching contacts, calls and messages across formats
+    add_phone_numbers,
+    # 7: analytics rollups maintained by triggers on the raw tables
+    rollups.create_rollups,
+    # 8: Parquet partitions written by archive.py, with their time span for pruning
+    '''
+    CREATE TABLE IF NOT EXISTS ArchivePartitions (
+        file_name TEXT PRIMARY KEY,
+        table_name TEXT NOT NULL,
+        month TEXT NOT NULL,
+        min_time DATETIME NOT NULL,
+        max_time DATETIME NOT NULL,
+        row_count INTEGER NOT NULL,
+        archived_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_archive_partitions_table_time ON ArchivePartitions (table_name, min_time, max_time);
+    ''',
+    # 9: per-table write versions behind the JSON API's ETags
+    versions.create_table_versions,
+    # 10: rollups are added per batch by ingest.bulk_insert instead of per row by insert triggers
+    rollups.drop_insert_triggers,
+    # 11: table versions are bumped once per insert batch instead of per row by insert triggers
+    versions.drop_insert_triggers,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn):
+    # Returns the (old, new) schema version. Both apps, process_files.py and every server worker
+    # may start at once, so the write lock is taken before user_version is re-read: one of them
+    # applies the pending migrations, the others wait and then find the schema current. All
+    # pending migrations commit together with the version bump, or none of them do.
+    version = schema_version(conn)
+    if version < SCHEMA_VERSION:
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            version = schema_version(conn)
+            for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+                if callable(migration):
+                    migration(conn)
+                else:
+                    db.execute_script(conn, migration)
+                conn.execute(f'PRAGMA user_version = {number}')
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    if version < SCHEMA_VERSION:
+        # Refresh planner statistics so the new indexes are actually chosen
+        conn.execute('ANALYZE')
+        conn.commit()
+    return version, SCHEMA_VERSION
@@ -0,0 +1,149 @@
+import asyncio
+import html
+import re
+import sqlite3
+
+import db
+
+# Text columns indexed per table. Each index is an external-content FTS5 table named
+# <table>_fts that stores only the index, not a second copy of the text.
+FTS_TABLES = {
+    'Messenger': ['contact_name', 'message_text'],
+    'SMS': ['phone_number', 'message_text'],
+    'Messages': ['from_to', 'message'],
+    'Keylogs': ['application', 'text'],
+    'Contacts': ['name', 'phone_number', 'email'],
+}
+
+SNIPPET_TOKENS = 12
+
+# Private-use markers survive html.escape, then become <mark> tags
+_HIGHLIGHT_START, _HIGHLIGHT_END = '\ue000', '\ue001'
+
+
+def table_exists(conn, table_name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = ?", (table_name,)).fetchone() is not None
+
+
+def is_indexed(conn, table_name):
+    return table_name in FTS_TABLES and table_exists(conn, f"{table_name}_fts")
+
+
+def create_fts_indexes(conn):
+    for table_name, columns in FTS_TABLES.items():
+        if not table_exists(conn, table_name) or table_exists(conn, f"{table_name}_fts"):
+            continue
+        fts = f"{table_name}_fts"
+        column_list = ', '.join(columns)
+        new_values = ', '.join(f"new.{column}" for column in columns)
+        old_values = ', '.join(f"old.{column}" for column in columns)
+        db.execute_script(conn, f'''
+            CREATE VIRTUAL TABLE {fts} USING fts5({column_list}, content='{table_name}', tokenize='unicode61');
+            CREATE TRIGGER {fts}_insert AFTER INSERT ON {table_name} BEGIN
+                INSERT INTO {fts}(rowid, {column_list}) VALUES (new.rowid, {new_values});
+            END;
+            CREATE TRIGGER {fts}_delete AFTER DELETE ON {table_name} BEGIN
+                INSERT INTO {fts}({fts}, rowid, {column_list}) VALUES ('delete', old.rowid, {old_values});
+            END;
+            CREATE TRIGGER {fts}_update AFTER UPDATE ON {table_name} BEGIN
+                INSERT INTO {fts}({fts}, rowid, {column_list}) VALUES ('delete', old.rowid, {old_values});
+                INSERT INTO {fts}(rowid, {column_list}) VALUES (new.rowid, {new_values});
+            END;
+            INSERT INTO {fts}({fts}) VALUES ('rebuild');
+        ''')
+
+
+def fts_query(term):
+    # "quoted text" becomes a phrase query; every other word matches as a prefix
+    phrases = re.findall(r'"([^"]+)"', term)
+    words = re.findall(r'\w+', re.sub(r'"[^"]*"?', ' ', term))
+    parts = ['"' + phrase.replace('"', '""') + '"' for phrase in phrases]
+    parts += ['"' + word + '"*' for word in words]
+    return ' '.join(parts)
+
+
+def highlight(snippet):
+    text = html.escape(snippet or '')
+    return text.replace(_HIGHLIGHT_START, '<mark>').replace(_HIGHLIGHT_END, '</mark>')
+
+
+def search(conn, table_name, term, limit=50, offset=0, rowids=None):
+    query = fts_query(term)
+    if not query:
+        return []
+    fts = f"{table_name}_fts"
+    restrict = f"AND t.rowid IN ({', '.join('?' for _ in rowids)})" if rowids is not None else ''
+    result = conn.execute(f'''
+        SELECT t.rowid AS _rowid, t.*,
+               snippet({fts}, -1, ?, ?, '…', ?) AS snippet
+        FROM {fts}
+        JOIN {table_name} t ON t.rowid = {fts}.rowid
+        WHERE {fts} MATCH ? {restrict}
+        ORDER BY rank
+        LIMIT ? OFFSET ?
+    ''', (_HIGHLIGHT_START, _HIGHLIGHT_END, SNIPPET_TOKENS, query, *(rowids or ()), limit, offset))
+    names = [description[0] for description in result.description]
+    rows = [dict(zip(names, row)) for row in result.fetchall()]
+    for row in rows:
+        row['snippet'] = highlight(row['snippet'])
+    return rows
+
+
+class SearchPipeline:
+    # Debounces keystrokes, interrupts the query still running for an older term, and
+    # narrows the previous result when the new term only extends it. version() returns the
+    # table's write version; a previous result is only narrowed while the version is unchanged,
+    # so rows imported since are not left out.
+    def __init__(self, database_file, fetch, delay=0.3, version=None):
+        self.conn = db.connect(database_file, check_same_thread=False)
+        self.fetch = fetch
+        self.delay = delay
+        self.version = version
+        self.generation = 0
+        self.task = None
+        self.previous = None
+
+    async def submit(self, term):
+        # Returns fetch()'s (rows, next_cursor), or None if a newer term superseded this one
+        self.generation += 1
+        generation = self.generation
+        # The query still running is for an older term: stop it now, and debounce only the new one
+        if self.task and not self.task.done():
+            self.conn.interrupt()
+        await asyncio.sleep(self.delay)
+        if generation != self.generation:
+            return None
+
+        if self.task and not self.task.done():
+            # Again, in case it had not yet started executing when interrupted above
+            self.conn.interrupt()
+            await asyncio.wait([self.task])
+
+        version = await asyncio.to_thread(self.version) if self.version else None
+        rowids = None
+        if self.previous and term.startswith(self.previous[0]) and self.previous[2] == version:
+            rowids = self.previous[1]
+
+        self.task = asyncio.ensure_future(asyncio.to_thread(self.fetch, self.conn, term, rowids))
+        try:
+            rows, next_cursor = await self.task
+        except sqlite3.OperationalError as e:
+            if 'interrupted' in str(e):
+                return None
+            raise
+        if generation != self.generation:
+            return None
+
+        # A result that fits on one page is complete, so longer terms can filter just these rows
+        complete = term and rows and next_cursor is None
+        self.previous = (term, [row['_rowid'] for row in rows], version) if complete else None
+        return rows, next_cursor
+
+    def close(self):
+        # Pending terms are dropped; a query still running is interrupted and closes the connection when it ends
+        self.generation += 1
+        if self.task and not self.task.done():
+            self.conn.interrupt()
+            self.task.add_done_callback(lambda _: self.conn.close())
+        else:
+            self.conn.close()
@@ -0,0 +1,39 @@
+import pytest
+
+pytest.importorskip('pandas')
+pytest.importorskip('pyarrow')
+
+import archive
+import db
+import ingest
+import schema
+
+ROWS = [
+    ('Chrome', '2023-01-05 10:00:00', 'hello'),
+    ('Chrome', '2023-01-20 11:30:00', 'world'),
+    ('Notes', '2023-02-02 09:15:00', 'draft'),
+    ('Notes', '2024-06-01 08:00:00', 'recent'),
+]
+
+
+def keylog_totals(conn):
+    return conn.execute("SELECT SUM(entries), SUM(characters) FROM KeylogRollup WHERE period = 'day'").fetchone()
+
+
+def test_reimport_after_archiving(tmp_path):
+    conn = db.connect(str(tmp_path / 'data.db'))
+    schema.migrate(conn)
+    assert ingest.bulk_insert(conn, 'Keylogs', ROWS) == len(ROWS)
+    totals = keylog_totals(conn)
+
+    archived = archive.archive_table(conn, 'Keylogs', '2024-01-01', str(tmp_path / 'archive'))
+    assert archived == [('2023-01', 2), ('2023-02', 1)]
+
+    # The archived months are closed; only a row from a live month gets in again
+    assert ingest.bulk_insert(conn, 'Keylogs', ROWS + [('Notes', '2024-06-02 08:00:00', 'new')]) == 1
+    assert conn.execute('SELECT COUNT(*) FROM Keylogs').fetchone()[0] == 2
+    assert keylog_totals(conn) == (totals[0] + 1, totals[1] + 3)
+
+    rows = [row for _, batch in archive.query(conn, 'Keylogs', archive_dir=str(tmp_path / 'archive')) for row in batch]
+    assert len(rows) == len(ROWS) + 1
+    conn.close()
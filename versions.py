@@ -0,0 +1,105 @@
+import os
+import threading
+from collections import OrderedDict
+
+import db
+
+# Write counter per raw table, so every writer (both apps, process_files.py, archive.py, other
+# server processes) invalidates cached API responses. Readers compare against these to answer
+# If-None-Match without running the query. Inserts bump it once per write through bump(); updates
+# and deletes still bump it per row from triggers.
+VERSIONED_TABLES = ('Calls', 'Messenger', 'SMS', 'Messages', 'Contacts', 'InstalledApps', 'Keylogs')
+# Serialized API responses kept per process
+RESPONSE_CACHE_SIZE = 256
+
+
+def create_table_versions(conn):
+    statements = ['CREATE TABLE IF NOT EXISTS TableVersions (table_name TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0);']
+    for table_name in VERSIONED_TABLES:
+        statements.append(f"INSERT OR IGNORE INTO TableVersions (table_name) VALUES ('{table_name}');")
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            statements.append(f'''
+                CREATE TRIGGER IF NOT EXISTS version_{table_name.lower()}_{event.lower()} AFTER {event} ON {table_name} BEGIN
+                    UPDATE TableVersions SET version = version + 1 WHERE table_name = '{table_name}';
+                END;''')
+    db.execute_script(conn, '\n'.join(statements))
+
+
+def drop_insert_triggers(conn):
+    # Replaced by bump() after each insert batch; the update and delete triggers stay
+    statements = [f"DROP TRIGGER IF EXISTS version_{table_name.lower()}_insert;" for table_name in VERSIONED_TABLES]
+    db.execute_script(conn, '\n'.join(statements))
+
+
+def bump(conn, table_name):
+    # Called inside the writer's transaction, so the new version commits with the rows
+    conn.execute('UPDATE TableVersions SET version = version + 1 WHERE table_name = ?', (table_name,))
+
+
+class VersionCache:
+    # Table versions as of the last commit seen, plus recent responses built at those versions.
+    # PRAGMA data_version on this connection changes only when another connection commits (in
+    # this process or any other), so checking it reads no table pages; the TableVersions rows are
+    # re-read, and responses for tables that changed dropped, only after an actual write.
+    # The connection is opened on first use in each process, never inherited across a fork.
+    def __init__(self, database_file, size=RESPONSE_CACHE_SIZE):
+        self.database_file = database_file
+        self.size = size
+        self.lock = threading.Lock()
+        self.conn = None
+        self.pid = None
+        self.data_version = None
+        self.versions = {}
+        self.responses = OrderedDict()
+        self.reloads = 0
+        self.hits = 0
+        self.misses = 0
+
+    def refresh(self):
+        if self.pid != os.getpid():
+            self.conn = db.connect(self.database_file, check_same_thread=False)
+            self.pid = os.getpid()
+            self.data_version = None
+            self.responses.clear()
+        data_version = self.conn.execute('PRAGMA data_version').fetchone()[0]
+        if data_version != self.data_version:
+            self.versions = dict(self.conn.execute('SELECT table_name, version FROM TableVersions'))
+            self.data_version = data_version
+            self.reloads += 1
+            for key, (table_name, version, _) in list(self.responses.items()):
+                if self.versions.get(table_name) != version:
+                    del self.responses[key]
+
+    def get(self, table_name):
+        with self.lock:
+            self.refresh()
+            return self.versions.get(table_name)
+
+    def cached(self, key):
+        with self.lock:
+            entry = self.responses.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.responses.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def store(self, key, table_name, version, body):
+        with self.lock:
+            self.responses[key] = (table_name, version, body)
+            self.responses.move_to_end(key)
+            while len(self.responses) > self.size:
+                self.responses.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            return {'pid': self.pid, 'data_version': self.data_version, 'reloads': self.reloads,
+                    'responses': len(self.responses), 'hits': self.hits, 'misses': self.misses}
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None and self.pid == os.getpid():
+                self.conn.close()
+            self.conn = None
+            self.pid = None
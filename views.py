@@ -0,0 +1,68 @@
+import avatars
+import paging
+import rollups
+import search
+
+# The data behind each screen of the two apps, built without any UI. The apps call these inside
+# their own connection handling and metrics.query blocks, and benchmarks/run_benchmarks.py times
+# the same functions, so a change to a screen's queries shows up in the benchmark.
+
+
+def table_page(conn, table_name, sort=None, descending=False, cursor=None, term='', indexed=False, rowids=None):
+    # One page of the main app's table view as (rows, next cursor). A search on an indexed table
+    # is ranked by FTS5 and paged by offset; anything else is a keyset page, LIKE-filtered by term.
+    if term and indexed:
+        offset = cursor or 0
+        rows = search.search(conn, table_name, term, limit=paging.PAGE_SIZE + 1, offset=offset, rowids=rowids)
+        return rows[:paging.PAGE_SIZE], (offset + paging.PAGE_SIZE if len(rows) > paging.PAGE_SIZE else None)
+    return paging.fetch_page(conn, table_name, sort_column=sort, descending=descending, cursor=cursor,
+                             search_term=term or None, rowids=rowids)
+
+
+# Each list page is newest first (contacts by name), as (rows, next_cursor); frequent is the set of
+# names whose avatars are inlined
+def calls_page(conn, cursor=None, frequent=()):
+    # Names are resolved per row through idx_contacts_phone_norm_name
+    calls, cursor = paging.fetch_page(conn, 'Calls', 'time', True, cursor, extra_columns=[
+        "(SELECT name FROM Contacts WHERE phone_norm = Calls.phone_norm ORDER BY name LIMIT 1) AS contact_name",
+    ])
+    for call in calls:
+        call['contact'] = call['contact_name'] or call['from_to']
+        call['avatar'] = avatars.image(call['contact'], frequent)
+    return calls, cursor
+
+
+def contacts_page(conn, cursor=None, frequent=()):
+    contacts, cursor = paging.fetch_page(conn, 'Contacts', 'name', False, cursor)
+    for contact in contacts:
+        contact['avatar'] = avatars.image(contact['name'], frequent)
+    return contacts, cursor
+
+
+def installed_apps_page(conn, cursor=None):
+    return paging.fetch_page(conn, 'InstalledApps', 'install_date', True, cursor)
+
+
+def keylogs_page(conn, cursor=None):
+    return paging.fetch_page(conn, 'Keylogs', 'time', True, cursor)
+
+
+def dashboard(conn):
+    # Everything here reads rollup tables only, so it costs the same however large the raw tables get
+    call_types = rollups.summary(conn, 'CallRollup', group_by=['call_type'], order_by='calls')
+    for row in call_types:
+        row.update(rollups.duration_percentiles(conn, row['call_type']))
+    top_contacts = rollups.summary(conn, 'CallRollup', group_by=['contact'], order_by='duration_sec', limit=10)
+    for row in top_contacts:
+        name = conn.execute("SELECT name FROM Contacts WHERE phone_norm = ? ORDER BY name LIMIT 1", (row['contact'],)).fetchone()
+        row['name'] = name[0] if name else row['contact']
+    messages_per_day = [row for row in rollups.summary(conn, 'MessageRollup', 'day', limit=30) if row['period_start']]
+    keylogs = rollups.summary(conn, 'KeylogRollup', group_by=['application'], order_by='characters', limit=10)
+    for row in call_types + top_contacts:
+        row['minutes'] = round(row['duration_sec'] / 60, 1)
+    return {
+        'call_types': call_types,
+        'top_contacts': top_contacts,
+        'messages_per_day': messages_per_day[::-1],
+        'keylogs': keylogs,
+    }